@@ -1,32 +1,73 @@
+from array import array
+from itertools import accumulate
+
+
+def _rotation_table(turns: int, *notations: [str]) -> {str: str}:
+    '''
+    Map each direction to the direction 'turns' x 90 degrees clockwise from it, in the same notation
+    '''
+    return {c: notation[(i + turns) % 4] for notation in notations for i, c in enumerate(notation)}
+
+
+def _translation_table(deltas: [int], direction_index: {str: int}, invalid: int) -> bytes:
+    '''
+    bytes.translate() table mapping each direction character to its delta as a signed byte, and anything else to
+    invalid
+    '''
+    return bytes(deltas[direction_index[chr(b)]] & 0xff if chr(b) in direction_index else invalid for b in range(256))
+
 
 class DirectionMapper:
     directions_carets: [str] = ['^','>','v','<']
     directions_compass: [str] = ['N','E','S','W']
     dx_dy: [(int,int)] = [(0,-1),(1,0),(0,1),(-1,0)]
 
+    # Constant-time lookup tables built from the lists above. Directions are indexed clockwise from North, so turning
+    # right is +1 and turning around is +2 (mod 4).
+    _direction_index: {str: int} = {**{c: i for i, c in enumerate(directions_carets)},
+                                    **{c: i for i, c in enumerate(directions_compass)}}
+    _dx_dy_index: {(int,int): int} = {d: i for i, d in enumerate(dx_dy)}
+    _rotate_right: {str: str} = _rotation_table(1, directions_carets, directions_compass)
+    _opposites: {str: str} = _rotation_table(2, directions_carets, directions_compass)
+    _rotate_left: {str: str} = _rotation_table(3, directions_carets, directions_compass)
+
+    # Tables for the bulk functions
+    _INVALID = 0x7f
+    _dx_table = _translation_table([dx for (dx, dy) in dx_dy], _direction_index, _INVALID)
+    _dy_table = _translation_table([dy for (dx, dy) in dx_dy], _direction_index, _INVALID)
+
     @staticmethod
-    def find_dx_dy(c: str):
-        if c in DirectionMapper.directions_carets:
-            return DirectionMapper.dx_dy[DirectionMapper.directions_carets.index(c.lower())]
-        elif c in DirectionMapper.directions_compass:
-            return DirectionMapper.dx_dy[DirectionMapper.directions_compass.index(c.upper())]
-        else:
+    def _find_index(c: str) -> int:
+        try:
+            return DirectionMapper._direction_index[c]
+        except KeyError:
             raise ValueError(f'Unknown direction {c}, please use either ^,>,v,< or N,E,S,W')
 
+    @staticmethod
+    def find_dx_dy(c: str):
+        return DirectionMapper.dx_dy[DirectionMapper._find_index(c)]
+
+    @staticmethod
+    def _find_dx_dy_index(dx_dy: (int,int)) -> int:
+        try:
+            return DirectionMapper._dx_dy_index[dx_dy]
+        except KeyError:
+            raise ValueError(f'{dx_dy} is not one of {DirectionMapper.dx_dy}')
+
     @staticmethod
     def find_direction_caret(dx_dy:(int,int)) -> str:
-        return DirectionMapper.directions_carets[DirectionMapper.dx_dy.index(dx_dy)]
+        return DirectionMapper.directions_carets[DirectionMapper._find_dx_dy_index(dx_dy)]
 
     @staticmethod
     def find_direction_compass(dx_dy:(int,int)) -> str:
-        return DirectionMapper.directions_compass[DirectionMapper.dx_dy.index(dx_dy)]
+        return DirectionMapper.directions_compass[DirectionMapper._find_dx_dy_index(dx_dy)]
 
     @staticmethod
     def _get_dx_dy_from_points(p1: (int,int), p2:(int,int)):
         (x1,y1) = p1
         (x2,y2) = p2
         dx_dy = (x2-x1, y2-y1)
-        if dx_dy not in DirectionMapper.dx_dy:
+        if dx_dy not in DirectionMapper._dx_dy_index:
             raise ValueError(f'{str(p1)} and {str(p2)} are not next to each other!')
 
         return dx_dy
@@ -43,13 +84,69 @@ class DirectionMapper:
 
     @staticmethod
     def opposite(direction: str):
-        opposites = {'N': 'S',
-                     'S': 'N',
-                     'E':' W',
-                     'W': 'E',
-                     '^': 'v',
-                     'v': '^',
-                     '>': '<',
-                     '<': '>'}
-
-        return opposites[direction]
+        return DirectionMapper._opposites[direction]
+
+    @staticmethod
+    def rotate_right(direction: str) -> str:
+        '''
+        Turn 90 degrees clockwise, keeping the same notation (e.g. N -> E, ^ -> >)
+        '''
+        return DirectionMapper._rotate_right[direction]
+
+    @staticmethod
+    def rotate_left(direction: str) -> str:
+        '''
+        Turn 90 degrees anti-clockwise, keeping the same notation (e.g. N -> W, ^ -> <)
+        '''
+        return DirectionMapper._rotate_left[direction]
+
+    @staticmethod
+    def instructions_to_dx_dy(instructions: str) -> (array, array):
+        '''
+        Convert a whole string of directions (e.g. '^^>v<<', carets and/or compass letters) into parallel arrays of
+        dx and dy in one pass. Whitespace, such as the line breaks of a multi-line instruction block, is skipped.
+
+        Args:
+            instructions: the directions, in order
+
+        Returns: (dx, dy) as signed byte arrays, one entry per direction
+        '''
+        raw = instructions.encode('ascii')
+        dx = raw.translate(DirectionMapper._dx_table, b' \t\r\n')
+        dy = raw.translate(DirectionMapper._dy_table, b' \t\r\n')
+        if DirectionMapper._INVALID in dx:
+            unknown = [c for c in instructions if not c.isspace() and c not in DirectionMapper._direction_index]
+            raise ValueError(f'Unknown direction {unknown[0]}, please use either ^,>,v,< or N,E,S,W')
+
+        return array('b', dx), array('b', dy)
+
+    @staticmethod
+    def instructions_to_positions(instructions: str, start: (int,int) = (0,0)) -> (array, array):
+        '''
+        Follow a whole string of directions from start (see instructions_to_dx_dy()).
+
+        Returns: (x, y) as arrays of the position after each move
+        '''
+        (dx, dy) = DirectionMapper.instructions_to_dx_dy(instructions)
+        (x0, y0) = start
+        return array('q', accumulate(dx, initial=x0))[1:], array('q', accumulate(dy, initial=y0))[1:]
+
+
+if __name__ == '__main__':
+    assert DirectionMapper.find_dx_dy('E') == DirectionMapper.find_dx_dy('>') == (1, 0)
+    assert DirectionMapper.find_direction_caret((0, 1)) == 'v'
+    assert DirectionMapper.find_direction_compass_between_points((3, 3), (3, 2)) == 'N'
+    assert [DirectionMapper.opposite(c) for c in 'NESW^>v<'] == list('SWNEv<^>')
+    assert [DirectionMapper.rotate_right(c) for c in 'NESW^>v<'] == list('ESWN>v<^')
+    assert [DirectionMapper.rotate_left(c) for c in 'NESW^>v<'] == list('WNES<^>v')
+
+    (dx, dy) = DirectionMapper.instructions_to_dx_dy('^^>v\n<<')
+    assert list(zip(dx, dy)) == [DirectionMapper.find_dx_dy(c) for c in '^^>v<<']
+    (x, y) = DirectionMapper.instructions_to_positions('^^>v<<', start=(5, 5))
+    assert list(zip(x, y)) == [(5, 4), (5, 3), (6, 3), (6, 4), (5, 4), (4, 4)]
+    for bad in ['^x', 'n']:
+        try:
+            DirectionMapper.instructions_to_dx_dy(bad)
+            assert False
+        except ValueError:
+            pass
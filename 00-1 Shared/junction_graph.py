@@ -0,0 +1,245 @@
+from map import MapBase, MapWithStartAndEnd
+from collections import deque
+from heapq import heappush, heappop
+from typing import Optional, Tuple, Dict, Set, List, Iterator
+
+
+class JunctionGraph:
+    '''
+    Compresses the open cells of a map into a graph of junctions. The nodes are the start, the end, any extra
+    positions requested and every cell that does not have exactly 2 open neighbours (branches and dead-ends); each
+    non-branching corridor between two nodes becomes an edge whose length is the number of steps along it. A loop
+    of corridor cells with no junction on it gets one of its cells as a node.
+
+    Most cells in a maze are corridor cells, so searching the graph touches far fewer positions than searching the
+    grid. Routes through the graph are mapped back to grid positions with path_positions(), which gives a list that
+    can be passed to MapSolver.render() as an overlay.
+    '''
+    def __init__(self, map: MapBase,
+                 allow_diagonal=False,
+                 extra_nodes: Optional[List[Tuple[int, int]]] = None,
+                 exclude_positions: Optional[Set[Tuple[int, int]]] = None):
+        '''
+        Args:
+            map: The map to compress
+            allow_diagonal: Treat diagonal neighbours as connected
+            extra_nodes: Positions that must be nodes even in the middle of a corridor (the map start and end always
+                         are)
+            exclude_positions: Cells to treat as walls
+        '''
+        self._map = map
+        self.allow_diagonal = allow_diagonal
+        self._exclude_positions = set(exclude_positions) if exclude_positions else set()
+
+        self.nodes: List[Tuple[int, int]] = []                 # node id -> position
+        self.node_ids: Dict[Tuple[int, int], int] = {}         # position -> node id
+        # edges[n] lists (to node, corridor) for each open neighbour of node n, in the same order as
+        # MapBase.open_positions_around_position(). The corridor runs from that neighbour up to and including the
+        # node at the far end, so len(corridor) is the length of the edge.
+        self.edges: List[List[Tuple[int, List[Tuple[int, int]]]]] = []
+        self._corridor_edges: Dict[Tuple[int, int], Tuple[int, int]] = {}  # corridor cell -> (node id, edge index)
+
+        required_nodes = [p for p in [map.start, map.end] + (extra_nodes or []) if p is not None]
+        self._build(set(required_nodes))
+
+    def _open_neighbours(self, position: (int, int)) -> [(int, int)]:
+        return [p for p in self._map.open_positions_around_position(position=position,
+                                                                    allow_diagonal=self.allow_diagonal)
+                if p not in self._exclude_positions]
+
+    def _is_open(self, position: (int, int)) -> bool:
+        return self._map.can_move_here(position) and position not in self._exclude_positions
+
+    def _add_node(self, position: (int, int)) -> int:
+        self.node_ids[position] = len(self.nodes)
+        self.nodes.append(position)
+        return self.node_ids[position]
+
+    def _build(self, required_nodes: Set[Tuple[int, int]]):
+        corridor_positions = []
+        for y in range(0, self._map.height):
+            for x in range(0, self._map.width):
+                if not self._is_open((x, y)):
+                    continue
+
+                if (x, y) in required_nodes or len(self._open_neighbours((x, y))) != 2:
+                    self._add_node((x, y))
+                else:
+                    corridor_positions.append((x, y))
+
+        for node in range(0, len(self.nodes)):
+            self._add_edges(node)
+
+        for position in corridor_positions:   # anything not yet covered is on a loop with no junctions
+            if position not in self._corridor_edges:
+                self._add_edges(self._add_node(position))
+
+    def _add_edges(self, node: int):
+        node_edges = []
+        for position in self._open_neighbours(self.nodes[node]):
+            corridor = [position]
+            previous_position = self.nodes[node]
+            while position not in self.node_ids:
+                (position, previous_position) = ([p for p in self._open_neighbours(position)
+                                                  if p != previous_position][0], position)
+                corridor.append(position)
+
+            for corridor_position in corridor[:-1]:
+                self._corridor_edges.setdefault(corridor_position, (node, len(node_edges)))
+            node_edges.append((self.node_ids[position], corridor))
+
+        self.edges.append(node_edges)
+
+    @property
+    def map(self):
+        return self._map
+
+    def node_id(self, position: (int, int)) -> int:
+        if position not in self.node_ids:
+            raise ValueError(f'{position} is not a node of the junction graph, please pass it in extra_nodes')
+        return self.node_ids[position]
+
+    def locate(self, position: (int, int)) -> Tuple[int, Optional[int]]:
+        '''
+        Find where a grid position lives in the graph.
+
+        Returns: (node id, None) for a node, or (node id, edge index) of one of the two edges whose corridor
+                 contains the position
+        '''
+        if position in self.node_ids:
+            return self.node_ids[position], None
+        if position not in self._corridor_edges:
+            raise ValueError(f'{position} is not an open position on the map')
+        return self._corridor_edges[position]
+
+    def path_positions(self, start_position: (int, int), corridors: List[List[Tuple[int, int]]]) -> [(int, int)]:
+        '''
+        Expand a path through the graph (the corridors of the edges taken, in order) back into grid positions.
+        '''
+        positions = [start_position]
+        for corridor in corridors:
+            positions.extend(corridor)
+        return positions
+
+    def reachable_nodes(self, position: (int, int)) -> Set[Tuple[int, int]]:
+        '''
+        Returns: The positions of all nodes that can be reached from the node at position (including itself)
+        '''
+        start_node = self.node_id(position)
+        seen = {start_node}
+        nodes = deque([start_node])
+        while nodes:
+            node = nodes.popleft()
+            for (next_node, _) in self.edges[node]:
+                if next_node not in seen:
+                    seen.add(next_node)
+                    nodes.append(next_node)
+
+        return {self.nodes[node] for node in seen}
+
+    def is_reachable(self, from_position: (int, int), to_position: (int, int)) -> bool:
+        return to_position in self.reachable_nodes(from_position)
+
+    def shortest_path(self, start_position: (int, int), end_position: (int, int)) -> [(int, int)]:
+        '''
+        Dijkstra over the nodes, using the corridor lengths as edge weights.
+
+        Returns: The positions along one shortest route from start to end (as for MapSolver.render()), or [] if the end
+                 cannot be reached
+        '''
+        start_node = self.node_id(start_position)
+        end_node = self.node_id(end_position)
+
+        distances = {start_node: 0}
+        came_from = {}          # node -> (previous node, corridor)
+        heap = [(0, start_node)]
+        while heap:
+            (distance, node) = heappop(heap)
+            if distance > distances[node]:
+                continue
+            if node == end_node:
+                break
+
+            for (next_node, corridor) in self.edges[node]:
+                next_distance = distance + len(corridor)
+                if next_distance < distances.get(next_node, next_distance + 1):
+                    distances[next_node] = next_distance
+                    came_from[next_node] = (node, corridor)
+                    heappush(heap, (next_distance, next_node))
+
+        if end_node not in distances:
+            return []
+
+        corridors = []
+        node = end_node
+        while node != start_node:
+            (node, corridor) = came_from[node]
+            corridors.append(corridor)
+        return self.path_positions(start_position, list(reversed(corridors)))
+
+    def shortest_distance(self, start_position: (int, int), end_position: (int, int)) -> int:
+        '''
+        Returns: The number of steps on the shortest route from start to end, or -1 if the end cannot be reached
+        '''
+        return len(self.shortest_path(start_position, end_position)) - 1
+
+    def iter_paths(self, start_position: (int, int), end_position: (int, int)) -> Iterator[List[List[Tuple[int, int]]]]:
+        '''
+        Depth-first search (with an explicit stack rather than recursion) for every simple path from start to end.
+        The nodes on the current path are tracked as bits of a single integer.
+
+        Returns: generator of paths, each a list of the corridors that make up the path (see path_positions()). The
+                 list is reused for the next path, so copy it if it needs to be kept.
+        '''
+        if start_position == end_position:
+            return
+
+        start_node = self.node_id(start_position)
+        end_node = self.node_id(end_position)
+
+        corridors = []
+        path = [start_node]     # the nodes on the current path...
+        next_edges = [0]        # ...and, for each, the next of its edges to try
+        visited = 1 << start_node   # bit n is set when node n is on the current path
+        while path:
+            node = path[-1]
+            if next_edges[-1] == len(self.edges[node]):   # all paths through this node have been tried, step back
+                path.pop()
+                next_edges.pop()
+                visited ^= 1 << node
+                if corridors:
+                    corridors.pop()
+                continue
+
+            (next_node, corridor) = self.edges[node][next_edges[-1]]
+            next_edges[-1] += 1
+            if visited >> next_node & 1:
+                continue
+
+            corridors.append(corridor)
+            if next_node == end_node:
+                yield corridors
+                corridors.pop()
+            else:
+                path.append(next_node)
+                next_edges.append(0)
+                visited |= 1 << next_node
+
+    def __str__(self):
+        return f'{len(self.nodes)} nodes, {sum([len(e) for e in self.edges]) // 2} corridors'
+
+
+if __name__ == '__main__':
+    map = MapWithStartAndEnd('test_map_2.txt')
+    graph = JunctionGraph(map)
+    assert graph.shortest_distance(map.start, map.end) == 22
+    route = graph.shortest_path(map.start, map.end)
+    assert route[0] == map.start and route[-1] == map.end and len(set(route)) == len(route)
+    assert len(list(graph.iter_paths(map.start, map.end))) == 8
+    assert graph.is_reachable(map.start, map.end)
+    assert graph.locate(graph.nodes[0]) == (0, None)
+
+    map = MapWithStartAndEnd('test_map.txt')
+    graph = JunctionGraph(map)
+    assert graph.shortest_distance(map.start, map.end) == 84
+    assert len(graph.nodes) == 2    # a single corridor from start to end
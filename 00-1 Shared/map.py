@@ -1,16 +1,27 @@
-
+import mmap
+import os
+import re
+import tempfile
 from direction_mapper import DirectionMapper
+from map_renderer import MapRenderer
+from typing import Optional, Tuple, TextIO
 
 class MapBase:
     WALL = '#'
     PATH = '.'
+    DX_DY_ALL = [(-1,-1), (0,-1), (1,-1),
+                 (-1,0),          (1,0),
+                 (-1,1),  (0, 1), (1, 1)]
+    DX_DY_ORTHOGONAL = [(dx, dy) for (dx, dy) in DX_DY_ALL if abs(dx)+abs(dy) == 1]
 
     def __init__(self):
+        self._adjacency = {}  # allow_diagonal -> (offsets, neighbours), see _build_adjacency()
         self.map = []
         self.start = None
         self.end = None
 
     def populate_empty_map(self, width: int, height: int):
+        self.invalidate_adjacency()
         for y in range(0, height):
             self.map.append('.'*width)
 
@@ -20,40 +31,103 @@ class MapBase:
 
     def open_positions_around_position(self, position: (int, int), allow_diagonal=False) -> [(int,int)]:
         (x,y) = position
-        dx_dy = [(-1,-1), (0,-1), (1,-1),
-                 (-1,0),          (1,0),
-                 (-1,1),  (0, 1), (1, 1)]
-
-        open_positions = []
-        for (dx, dy) in dx_dy:
-            if not allow_diagonal and abs(dx)+abs(dy) == 2:  #skip diagonals if not allowed
-                continue
-
-            if self.can_move_here((x+dx, y+dy)):
-                open_positions.append((x+dx,y+dy))
+        if not self.is_valid(position):  # the adjacency index only covers cells on the map
+            return [(x+dx, y+dy) for (dx, dy) in self._dx_dy(allow_diagonal) if self.can_move_here((x+dx, y+dy))]
 
-        return open_positions
+        width = self.width
+        return [(i % width, i // width) for i in self.neighbour_indices(y*width + x, allow_diagonal)]
 
     def open_dx_dy_around_position(self, position: (int, int), allow_diagonal=False) -> [str]:
         (x,y) = position
-        dx_dy = [(-1,-1), (0,-1), (1,-1),
-                 (-1,0),          (1,0),
-                 (-1,1),  (0, 1), (1, 1)]
+        return [(x1-x, y1-y) for (x1, y1) in self.open_positions_around_position(position, allow_diagonal)]
+
+    @staticmethod
+    def _dx_dy(allow_diagonal: bool) -> [(int,int)]:
+        return MapBase.DX_DY_ALL if allow_diagonal else MapBase.DX_DY_ORTHOGONAL
+
+    def neighbour_indices(self, index: int, allow_diagonal=False) -> [int]:
+        '''
+        Look up the open neighbours of a cell in the adjacency index, building the index first if necessary. Cells
+        are identified by their flat index y*width + x. The neighbours are returned in the same order as
+        open_positions_around_position().
+
+        Args:
+            index: flat index of the cell
+            allow_diagonal: use the 8-connected rather than the 4-connected index
+
+        Returns: list of the flat indices of the open neighbours
+        '''
+        adjacency = self._adjacency.get(allow_diagonal)
+        if adjacency is None:
+            adjacency = self._adjacency[allow_diagonal] = self._build_adjacency(allow_diagonal)
 
-        open_dx_dy = []
-        for (dx, dy) in dx_dy:
-            if not allow_diagonal and abs(dx)+abs(dy) == 2:  #skip diagonals if not allowed
-                continue
+        (masks, deltas) = adjacency
+        return [index + delta for delta in deltas[masks[index]]]
 
-            if self.can_move_here((x+dx, y+dy)):
-                open_dx_dy.append((dx,dy))
+    def _is_open_bytes(self) -> bytes:
+        '''
+        One byte per cell (index y*width + x), 1 if the cell is open and 0 for a wall
+        '''
+        open_bytes = bytes(0 if i == ord(MapBase.WALL) else 1 for i in range(256))
+        return b''.join([self.get_row(y).encode('ascii', 'replace').translate(open_bytes) for y in range(0, self.height)])
 
-        return open_dx_dy
+    def _build_adjacency(self, allow_diagonal: bool) -> (bytearray, [(int,)]):
+        '''
+        Build an index of the open neighbours of every cell, walls included: one byte per cell in which bit k is set
+        when the neighbour in direction _dx_dy()[k] is on the map and open. Each direction is worked out for the
+        whole map at once: the open cells, padded with a border of walls and shifted towards that direction, are read
+        as one big integer and moved up to bit k of every byte.
+
+        Returns: (masks, deltas) - the neighbour bits of each cell, and for every possible byte the flat index
+                 offsets of the neighbours it stands for
+        '''
+        width = self.width
+        height = self.height
+        dx_dy = self._dx_dy(allow_diagonal)
+
+        padded_width = width + 2
+        unpadded = self._is_open_bytes()
+        is_open = bytes(padded_width) + b''.join([b'\x00' + unpadded[y*width:(y+1)*width] + b'\x00'
+                                                  for y in range(0, height)]) + bytes(padded_width)
+        masks = 0
+        for (k, (dx, dy)) in enumerate(dx_dy):
+            neighbour_open = b''.join([is_open[(y+1+dy)*padded_width + 1+dx:(y+1+dy)*padded_width + 1+dx + width]
+                                       for y in range(0, height)])
+            masks |= int.from_bytes(neighbour_open, 'little') << k
+
+        deltas = [tuple(dy*width + dx for (k, (dx, dy)) in enumerate(dx_dy) if mask >> k & 1)
+                  for mask in range(0, 1 << len(dx_dy))]
+        return bytearray(masks.to_bytes(width*height, 'little')), deltas
+
+    def _update_adjacency(self, position: (int, int)):
+        '''
+        Patch the adjacency indexes after the cell at position has changed between wall and open. Only the cell and
+        its 8 neighbours can have different neighbour bits, so the rest of the index is kept.
+        '''
+        (x, y) = position
+        width = self.width
+        for (allow_diagonal, (masks, deltas)) in self._adjacency.items():
+            dx_dy = self._dx_dy(allow_diagonal)
+            for y1 in range(max(y-1, 0), min(y+2, self.height)):
+                for x1 in range(max(x-1, 0), min(x+2, width)):
+                    masks[y1*width + x1] = sum([1 << k for (k, (dx, dy)) in enumerate(dx_dy)
+                                                if self.can_move_here((x1+dx, y1+dy))])
+
+    def invalidate_adjacency(self):
+        '''
+        Discard the adjacency index. set_location() keeps the index up to date itself; call this after changing
+        self.map directly.
+        '''
+        self._adjacency.clear()
 
     def is_valid(self, position: (int,int)):
         (x,y) = position
         return 0 <= x < self.width and 0 <= y < self.height
 
+    def get_location(self, position: (int,int)) -> str:
+        (x, y) = position
+        return self.map[y][x]
+
     def find_locations(self, c: str) -> [(int,int)]:
         locations = [(x,y) for x in range(0, self.width) for y in range(0, self.height)]
         locations = [(x,y) for (x,y) in locations if self.map[y][x] == c]
@@ -64,7 +138,14 @@ class MapBase:
         if not self.is_valid(position):
             raise ValueError(f'({x},{y}) is not on the map!')
 
+        wall_changed = (self.map[y][x] == MapBase.WALL) != (c == MapBase.WALL)
         self.map[y] = str(self.map[y][:x]) + c + str(self.map[y][x+1:])
+        if wall_changed:
+            self._update_adjacency(position)
+
+    def append_row(self, row: str):
+        self.invalidate_adjacency()
+        self.map.append(row)
 
     @property
     def width(self) -> int:
@@ -74,9 +155,24 @@ class MapBase:
     def height(self) -> int:
         return len(self.map)
 
-    def render(self):
-        for row in self.map:
-            print(row)
+    def get_row(self, y: int) -> str:
+        return self.map[y]
+
+    def render(self,
+               overlay_route: Optional[list[Tuple[int,int]]] = None,
+               top_left: Optional[Tuple[int,int]] = None,
+               bottom_right: Optional[Tuple[int,int]] = None,
+               stream: Optional[TextIO] = None):
+        renderer = MapRenderer(self)
+        renderer.write(renderer.map_frame(overlay_route, top_left, bottom_right), stream)
+
+    def render_preview(self,
+                       max_width: int = 120,
+                       max_height: int = 60,
+                       overlay_route: Optional[list[Tuple[int,int]]] = None,
+                       stream: Optional[TextIO] = None):
+        renderer = MapRenderer(self)
+        renderer.write(renderer.preview_frame(max_width, max_height, overlay_route), stream)
 
     def __str__(self):
         return f'{self.width}x{self.height} map'
@@ -92,7 +188,7 @@ class Map(MapBase):
                 self.process_row(row.strip())
 
     def process_row(self, row: str):
-        self.map.append(row)
+        self.append_row(row)
 
 
 class MapWithStartAndEnd(Map):
@@ -104,7 +200,7 @@ class MapWithStartAndEnd(Map):
 
     def process_row(self, row: str):
         super().process_row(row)
-        y = len(self.map)-1
+        y = self.height-1
         start_x = row.find(self._start_text)
         end_x = row.find(self._end_text)
 
@@ -114,7 +210,269 @@ class MapWithStartAndEnd(Map):
         if end_x >= 0:
             self.end = (end_x, y)
 
+
+class CompactMapBase(MapBase):
+    '''
+    Alternate storage for MapBase that keeps the whole grid in a single bytearray (one byte per cell) with a fixed row
+    stride (the width, unless the buffer also holds line endings - see MappedMap). A write through set_location() is a
+    single byte assignment rather than rebuilding the row string, so solvers that mutate the map stay O(1) per write
+    on very large grids.
+
+    Mix in ahead of a loader class (see CompactMap and CompactMapWithStartAndEnd) so that rows are appended to the
+    buffer as they are read. Cells must be single-byte (ASCII) characters.
+
+    Neighbours are worked out from the grid when asked for rather than from an adjacency index, which would take at
+    least as much memory again as the grid itself.
+    '''
+    _WALL_BYTE = ord(MapBase.WALL)
+
+    @property
+    def map(self) -> [str]:
+        '''
+        Decoded copy of the rows, kept for compatibility with code that reads MapBase.map directly. Prefer
+        get_location() and the other accessors, which do not copy the buffer.
+        '''
+        return [self.get_row(y) for y in range(0, self._height)]
+
+    @map.setter
+    def map(self, rows: [str]):
+        self.invalidate_adjacency()
+        self.grid = bytearray()
+        self._width = 0
+        self._stride = 0
+        self._height = 0
+        for row in rows:
+            self.append_row(row)
+
+    def populate_empty_map(self, width: int, height: int):
+        self.invalidate_adjacency()
+        if self._height > 0 and width != self._width:
+            raise ValueError(f'Cannot add rows of width {width} to a map of width {self._width}')
+
+        self._width = width
+        self._stride = width
+        self._height += height
+        self.grid += MapBase.PATH.encode('ascii') * (width*height)
+
+    def append_row(self, row: str):
+        self.invalidate_adjacency()
+        if self._height == 0:
+            self._width = len(row)
+            self._stride = len(row)
+        elif len(row) != self._width:
+            raise ValueError(f'Row {self._height} has width {len(row)}, expected {self._width}')
+
+        self.grid += row.encode('ascii')
+        self._height += 1
+
+    def can_move_here(self, position: (int, int)):
+        (x,y) = position
+        return 0 <= x < self._width and 0 <= y < self._height and \
+            self.grid[y*self._stride + x] != CompactMapBase._WALL_BYTE
+
+    def open_positions_around_position(self, position: (int, int), allow_diagonal=False) -> [(int,int)]:
+        (x,y) = position
+        return [(x+dx, y+dy) for (dx, dy) in self._dx_dy(allow_diagonal) if self.can_move_here((x+dx, y+dy))]
+
+    def neighbour_indices(self, index: int, allow_diagonal=False) -> [int]:
+        (y, x) = divmod(index, self._width)
+        return [index + dy*self._width + dx for (dx, dy) in self._dx_dy(allow_diagonal)
+                if self.can_move_here((x+dx, y+dy))]
+
+    def get_location(self, position: (int,int)) -> str:
+        (x, y) = position
+        return chr(self.grid[y*self._stride + x])
+
+    def find_locations(self, c: str) -> [(int,int)]:
+        locations = []
+        b = c.encode('ascii')
+        i = self.grid.find(b)
+        while i >= 0:
+            (y, x) = divmod(i, self._stride)
+            if x < self._width:
+                locations.append((x, y))
+            i = self.grid.find(b, i+1)
+
+        return sorted(locations)  # same (x, y) order as MapBase.find_locations
+
+    def set_location(self, position: (int,int), c: str):
+        (x, y) = position
+        if not self.is_valid(position):
+            raise ValueError(f'({x},{y}) is not on the map!')
+        if len(c) != 1:
+            raise ValueError(f'Compact maps store one character per cell, not "{c}"')
+
+        self.grid[y*self._stride + x] = ord(c)
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    @property
+    def height(self) -> int:
+        return self._height
+
+    def get_row(self, y: int) -> str:
+        return bytes(self.row_view(y)).decode('ascii')
+
+    def row_view(self, y: int) -> memoryview:
+        '''
+        Zero-copy view of the bytes of a row
+        '''
+        return memoryview(self.grid)[y*self._stride:y*self._stride + self._width]
+
+
+class CompactMap(CompactMapBase, Map):
+    pass
+
+
+class CompactMapWithStartAndEnd(CompactMapBase, MapWithStartAndEnd):
+    pass
+
+
+class MappedMap(CompactMapBase):
+    '''
+    A compact map whose buffer is the input file itself, memory-mapped rather than read. The row stride is worked out
+    once from the first line ending, and the file is checked with a single regular expression scan, so nothing is
+    copied into Python objects; the operating system pages the file in and can drop it again under memory pressure.
+    The mapping is copy-on-write, so set_location() changes the map in memory but never the file.
+
+    Every row must have the same width and line ending, otherwise a ValueError is raised. Call close() (or use a with
+    block) to release the file.
+    '''
+    def __init__(self, filename: str):
+        super().__init__()
+        self._file = open(filename, 'rb')
+        try:
+            self.grid = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f'{filename} is empty')
+        try:
+            self._measure(filename)
+        except ValueError:
+            self.close()
+            raise
+
+    def _measure(self, filename: str):
+        grid = self.grid
+        newline = grid.find(b'\n')
+        if newline < 0:  # a single row with no line ending
+            (self._width, self._stride, self._height) = (len(grid), len(grid), 1)
+            return
+
+        self._width = newline - 1 if newline > 0 and grid[newline-1] == ord('\r') else newline
+        self._stride = newline + 1
+        line_ending_length = self._stride - self._width
+
+        end = len(grid)     # ignore line endings (and blank lines) at the end of the file
+        while end > 0 and grid[end-1] in b'\r\n':
+            end -= 1
+
+        # One pass over the buffer in C, so a line ending in the middle of a row can never be read as a cell
+        line_ending = re.escape(grid[self._width:self._stride])
+        row = b'[^\r\n]{%d}' % self._width
+        rows = re.compile(b'(?:' + row + line_ending + b')*' + row)
+        if rows.fullmatch(grid, 0, end) is None:
+            raise ValueError(f'The rows in {filename} are not all {self._width} wide')
+        self._height = (end + line_ending_length) // self._stride
+
+    def append_row(self, row: str):
+        raise ValueError('Rows cannot be added to a memory-mapped map')
+
+    def populate_empty_map(self, width: int, height: int):
+        raise ValueError('Rows cannot be added to a memory-mapped map')
+
+    def close(self):
+        self.grid.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class MappedMapWithStartAndEnd(MappedMap):
+    def __init__(self, filename: str, start_text: str='S', end_text: str='E'):
+        self._start_text = start_text
+        self._end_text = end_text
+
+        super().__init__(filename)
+        self._find_start_and_end()
+
+    def _find_start_and_end(self):
+        '''
+        Locate the first start and end markers with one pass over the buffer, stopping once both have been found
+        '''
+        start_text = self._start_text.encode('ascii')
+        end_text = self._end_text.encode('ascii')
+        markers = re.compile(re.escape(start_text) + b'|' + re.escape(end_text))
+        for match in markers.finditer(self.grid):
+            (y, x) = divmod(match.start(), self._stride)
+            if match.group() == start_text and self.start is None:
+                self.start = (x, y)
+            elif match.group() == end_text and self.end is None:
+                self.end = (x, y)
+
+            if self.start is not None and self.end is not None:
+                break
+
+
 if __name__ == '__main__':
     map = MapWithStartAndEnd('test_map.txt')
     assert map.start == (1, 3)
     assert map.end == (5, 7)
+
+    compact_map = CompactMapWithStartAndEnd('test_map.txt')
+    assert compact_map.start == (1, 3)
+    assert compact_map.end == (5, 7)
+    assert (compact_map.width, compact_map.height) == (map.width, map.height)
+    assert compact_map.map == map.map
+    assert compact_map.find_locations(MapBase.PATH) == map.find_locations(MapBase.PATH)
+    assert compact_map.open_positions_around_position((3, 1)) == map.open_positions_around_position((3, 1))
+    compact_map.set_location((3, 2), MapBase.WALL)
+    assert not compact_map.can_move_here((3, 2))
+    assert compact_map.map[2] == '#.###.#.#.###.#'
+    assert compact_map.open_positions_around_position((3, 1)) == [(2, 1)]
+    assert compact_map.neighbour_indices(1*compact_map.width + 3) == [1*compact_map.width + 2]
+    assert not compact_map._adjacency    # compact maps never build an index
+
+    for allow_diagonal in [False, True]:
+        for x in range(-1, map.width+1):
+            for y in range(-1, map.height+1):
+                expected = [(x+dx, y+dy) for (dx, dy) in MapBase._dx_dy(allow_diagonal) if map.can_move_here((x+dx, y+dy))]
+                assert map.open_positions_around_position((x, y), allow_diagonal) == expected
+
+    with MappedMapWithStartAndEnd('test_map.txt') as mapped_map:
+        assert (mapped_map.start, mapped_map.end) == (map.start, map.end)
+        assert (mapped_map.width, mapped_map.height) == (map.width, map.height)
+        assert mapped_map.map == map.map
+        assert mapped_map.find_locations(MapBase.PATH) == map.find_locations(MapBase.PATH)
+        mapped_map.set_location((3, 2), MapBase.WALL)
+        assert mapped_map.get_row(2) == '#.###.#.#.###.#'
+        assert mapped_map.open_positions_around_position((3, 1)) == [(2, 1)]
+        try:
+            mapped_map.append_row(map.map[0])
+            assert False
+        except ValueError:
+            pass
+    with MappedMapWithStartAndEnd('test_map.txt') as mapped_map:
+        assert mapped_map.get_row(2) == map.map[2]     # the file itself is never changed
+    with tempfile.TemporaryDirectory() as directory:
+        malformed = os.path.join(directory, 'malformed.txt')
+        with open(malformed, 'w') as f:
+            f.write('...\n..\n....\n')     # the right total size for 3x3, but the rows are different widths
+        try:
+            MappedMap(malformed)
+            assert False
+        except ValueError:
+            pass
+
+    adjacency = map._adjacency[False]
+    map.set_location((1, 2), MapBase.WALL)
+    assert map._adjacency[False] is adjacency    # patched around the cell, not rebuilt
+    assert map.open_positions_around_position((1, 1)) == [(2, 1)]
+    map.set_location((1, 2), MapBase.PATH)
+    assert map.open_positions_around_position((1, 1)) == [(2, 1), (1, 2)]
@@ -0,0 +1,161 @@
+import sys
+from typing import Optional, Tuple, Set, TextIO
+
+
+class MapRenderer:
+    '''
+    Builds text frames of a map (and optionally its distance map) for MapBase.render() and MapSolver.render(). Each
+    frame is assembled as one string and written to the stream in a single call, overlays are looked up in sets,
+    and the frame can be limited to a window of the map or shrunk to a preview of a huge map.
+    '''
+    ROUTE = 'O'
+    SHORTCUT = '*'
+    UNREACHED = 'X'
+
+    def __init__(self, map, distance_map: Optional[list] = None, number_width: Optional[int] = None):
+        '''
+        Args:
+            map: The MapBase to draw
+            distance_map: A MapSolver distance map, required for distance_frame()
+            number_width: number_width() of the distance map if the caller already knows it, to save scanning the
+                          whole distance map again
+        '''
+        self._map = map
+        self._distance_map = distance_map
+        self._number_width = number_width
+
+    @staticmethod
+    def _positions(overlay) -> Set[Tuple[int, int]]:
+        '''
+        Accept either a list of positions or a route of (position, distance) steps
+        '''
+        if not overlay:
+            return set()
+        if isinstance(overlay[0][0], tuple):
+            return {position for (position, distance) in overlay}
+        return set(overlay)
+
+    def _window(self,
+                top_left: Optional[Tuple[int, int]],
+                bottom_right: Optional[Tuple[int, int]]) -> (int, int, int, int):
+        '''
+        Returns: (x_min, y_min, x_max, y_max) clipped to the map, where bottom_right (and so the max) is exclusive
+        '''
+        (x_min, y_min) = top_left if top_left else (0, 0)
+        (x_max, y_max) = bottom_right if bottom_right else (self._map.width, self._map.height)
+        return max(x_min, 0), max(y_min, 0), min(x_max, self._map.width), min(y_max, self._map.height)
+
+    @staticmethod
+    def number_width(distance_map: list) -> int:
+        '''
+        The number of characters needed for any distance in the distance map
+        '''
+        largest = max([max(row) for row in distance_map if row], default=-1)
+        smallest = min([min(row) for row in distance_map if row], default=-1)
+        return max(len(str(largest)), len(str(smallest)))
+
+    def map_frame(self,
+                  overlay_route=None,
+                  top_left: Optional[Tuple[int, int]] = None,
+                  bottom_right: Optional[Tuple[int, int]] = None) -> str:
+        '''
+        The map characters, one line per row, with the route cells replaced by ROUTE.
+        '''
+        (x_min, y_min, x_max, y_max) = self._window(top_left, bottom_right)
+        route_xs = {}   # y -> x positions of the route on that row
+        for (x, y) in self._positions(overlay_route):
+            route_xs.setdefault(y, []).append(x)
+
+        lines = []
+        for y in range(y_min, y_max):
+            row = self._map.get_row(y)[x_min:x_max]
+            if y in route_xs:
+                cells = list(row)
+                for x in route_xs[y]:
+                    if x_min <= x < x_max:
+                        cells[x - x_min] = MapRenderer.ROUTE
+                row = ''.join(cells)
+            lines.append(row + '\n')
+
+        return ''.join(lines)
+
+    def distance_frame(self,
+                       overlay_route=None,
+                       overlay_shortcut=None,
+                       top_left: Optional[Tuple[int, int]] = None,
+                       bottom_right: Optional[Tuple[int, int]] = None) -> str:
+        '''
+        Every cell as a fixed width box: the wall character, ROUTE or SHORTCUT for overlay cells, UNREACHED for open
+        cells without a distance, or the distance in brackets.
+        '''
+        (x_min, y_min, x_max, y_max) = self._window(top_left, bottom_right)
+        route_positions = self._positions(overlay_route)
+        shortcut_positions = self._positions(overlay_shortcut)
+        if self._number_width is None:
+            self._number_width = MapRenderer.number_width(self._distance_map)
+        number_width = self._number_width
+
+        wall = self._map.WALL
+        wall_cell = f'{wall * (number_width + 2)} '
+        route_cell = f'{MapRenderer.ROUTE * (number_width + 2)} '
+        unreached_cell = f'{MapRenderer.UNREACHED * (number_width + 2)} '
+        shortcut_cell = f'{MapRenderer.SHORTCUT * (number_width + 2)} '
+
+        lines = []
+        for y in range(y_min, y_max):
+            row = self._map.get_row(y)
+            distance_row = self._distance_map[y]
+            cells = []
+            for x in range(x_min, x_max):
+                if row[x] == wall:
+                    cells.append(wall_cell)
+                elif (x, y) in route_positions:
+                    cells.append(route_cell)
+                elif distance_row[x] < 0:
+                    cells.append(unreached_cell)
+                elif (x, y) in shortcut_positions:
+                    cells.append(shortcut_cell)
+                else:
+                    cells.append(f'[{distance_row[x]: >{number_width}}] ')
+            cells.append('\n')
+            lines.append(''.join(cells))
+
+        return ''.join(lines)
+
+    def preview_frame(self, max_width: int = 120, max_height: int = 60, overlay_route=None) -> str:
+        '''
+        A downsampled view of the whole map that fits in max_width x max_height characters. Each character stands
+        for a block of cells and shows ROUTE if the route passes through the block, the path character if any cell
+        in it is open, or the wall character if the block is solid wall.
+        '''
+        width = self._map.width
+        height = self._map.height
+        block_width = max(1, -(-width // max_width))
+        block_height = max(1, -(-height // max_height))
+        wall = self._map.WALL
+        path = self._map.PATH
+
+        route_blocks = {(x // block_width, y // block_height) for (x, y) in self._positions(overlay_route)}
+
+        lines = []
+        for block_y in range(0, -(-height // block_height)):
+            block_rows = [self._map.get_row(y)
+                          for y in range(block_y*block_height, min((block_y+1)*block_height, height))]
+            cells = []
+            for block_x in range(0, -(-width // block_width)):
+                x0 = block_x * block_width
+                x1 = min(x0 + block_width, width)
+                if (block_x, block_y) in route_blocks:
+                    cells.append(MapRenderer.ROUTE)
+                elif any([row[x0:x1].count(wall) < x1 - x0 for row in block_rows]):
+                    cells.append(path)
+                else:
+                    cells.append(wall)
+            cells.append('\n')
+            lines.append(''.join(cells))
+
+        return ''.join(lines)
+
+    @staticmethod
+    def write(frame: str, stream: Optional[TextIO] = None):
+        (stream if stream is not None else sys.stdout).write(frame)
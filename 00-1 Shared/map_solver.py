@@ -1,17 +1,47 @@
-from map import Map, MapBase, MapWithStartAndEnd
-import copy
-from typing import Optional, Tuple
+from map import Map, MapBase, MapWithStartAndEnd, CompactMapWithStartAndEnd
+import io
+from collections import deque
+from heapq import heappush, heappop
+from junction_graph import JunctionGraph
+from array import array
+from map_renderer import MapRenderer
+from typing import Optional, Tuple, Dict, Set, Iterator, TextIO
 
 
 class MapSolver:
     _debug = False
 
+    # Maps every byte to an ASCII '0' (wall) or '1' (open) so a whole row can be turned into a bit string in one call
+    _OPEN_CELL_BITS = bytes(ord('0') if i == ord(Map.WALL) else ord('1') for i in range(256))
+
     def __init__(self, map: MapBase,
-                 allow_diagonal_movement=False):
+                 allow_diagonal_movement=False,
+                 use_bitmask_bfs=False,
+                 full_distance_field=False):
+        '''
+        Args:
+            map: The map to solve
+            allow_diagonal_movement: Allow moves to the 4 diagonal neighbours as well as N, E, S and W
+            use_bitmask_bfs: Flood the distance map with bitmask_distance_field() rather than cell by cell. This is
+                             only faster on open maps (its cost grows with the number of BFS levels, so it is much
+                             slower on corridor mazes) and cannot consult allow_movement_to().
+            full_distance_field: Keep flooding until every reachable cell has a distance, rather than stopping once
+                                 the end has been reached (always the case if the map has no end)
+        '''
         self._map = map
         self.allow_diagonal_movement = allow_diagonal_movement
+        self.use_bitmask_bfs = use_bitmask_bfs
+        self.full_distance_field = full_distance_field or map.end is None
         self._distance_map = self._generate_distance_map()
-        self._populate_distance_map(self.distance_map)
+        self._number_width = None   # MapRenderer.number_width() of the distance map, kept until the distances change
+
+        if use_bitmask_bfs:
+            if type(self).allow_movement_to is not MapSolver.allow_movement_to:
+                raise ValueError(f'{type(self).__name__} overrides allow_movement_to(), which the bitmask BFS '
+                                 f'cannot honour')
+            self._populate_distance_map_bitmask(self.distance_map)
+        else:
+            self._populate_distance_map(self.distance_map)
 
     @property
     def map(self):
@@ -45,7 +75,7 @@ class MapSolver:
         visited_spaces = 0
         for y in range(0, self.map.height):
             for x in range(0, self.map.width):
-                if self.map.map[y][x] != Map.WALL:
+                if self.map.get_location((x,y)) != Map.WALL:
                     valid_spaces += 1
                     if self._distance_map[y][x] != -1:
                         visited_spaces += 1
@@ -54,9 +84,9 @@ class MapSolver:
     def _populate_distance_map(self, distance_map: [[int]]):
         distance = 0
         positions = [self._map.start]
-        (end_x, end_y) = self._map.end
+        (end_x, end_y) = self._map.end if self._map.end is not None else self._map.start
         n = 0
-        while distance_map[end_y][end_x] < 0 and positions:
+        while (self.full_distance_field or distance_map[end_y][end_x] < 0) and positions:
             n += 1
             if MapSolver._debug:
                 if n % 10000 == 0:
@@ -68,18 +98,224 @@ class MapSolver:
                 (x,y) = pos
                 if distance_map[y][x] == -1 or distance_map[y][x] > distance:
                     distance_map[y][x] = distance
-                    next_positions.extend(self._map.open_positions_around_position(position=pos,
-                                                                                   allow_diagonal=self.allow_diagonal_movement))
+                    next_positions.extend(self._open_neighbours(pos))
 
             distance += 1
             positions = next_positions
 
         return distance_map
 
+    def _populate_distance_map_bitmask(self, distance_map: [[int]]):
+        width = self._map.width
+        field = MapSolver.bitmask_distance_field(self._map,
+                                                 start=self._map.start,
+                                                 end=None if self.full_distance_field else self._map.end,
+                                                 allow_diagonal=self.allow_diagonal_movement)
+        for y in range(0, self._map.height):
+            distance_map[y] = field[y*width:(y+1)*width].tolist()
+
+        return distance_map
+
+    @staticmethod
+    def _open_cell_mask(map: MapBase) -> int:
+        '''
+        Build a single integer with one bit per cell that is set when the cell is not a wall. Cell (x,y) is bit
+        y*(width+1) + x; the extra (always clear) bit at the end of each row stops horizontal shifts from wrapping
+        onto the next row.
+        '''
+        bits = b''.join(b'0' + row.encode('ascii').translate(MapSolver._OPEN_CELL_BITS)[::-1]
+                        for row in reversed(map.map))
+        return int(bits, 2) if bits else 0
+
+    @staticmethod
+    def bitmask_distance_field(map: MapBase,
+                               start: (int, int),
+                               end: Optional[Tuple[int, int]] = None,
+                               allow_diagonal=False) -> array:
+        '''
+        Breadth-first flood from start that treats the whole frontier as one bitmask. Each step shifts the frontier
+        in the 4 (or 8) directions and masks it with the open cells that have not been visited yet, then records the
+        distance of every newly reached cell. The result matches _populate_distance_map().
+
+        Every step works on integers the size of the whole map, so the cost grows with the number of steps times the
+        size of the map. That only pays off on open maps, where there are few steps and each reaches many cells; on
+        mazes with long corridors it is much slower than the cell by cell flood.
+
+        Args:
+            map: The map to flood
+            start: The cell with distance 0
+            end: Stop once this cell has been reached, or None to compute the full field
+            allow_diagonal: Include the diagonal neighbours
+
+        Returns: Flat int32 array of width*height distances (index y*width + x), -1 where not reached
+
+        '''
+        width = map.width
+        stride = width + 1
+        distances = array('i', [-1]) * (width * map.height)
+
+        shifts = [1, stride] + ([stride - 1, stride + 1] if allow_diagonal else [])
+        end_bit = 1 << (end[1]*stride + end[0]) if end is not None else 0
+
+        unvisited = MapSolver._open_cell_mask(map)
+        frontier = 1 << (start[1]*stride + start[0])
+        unvisited &= ~frontier
+        distance = 0
+        while frontier:
+            # Decode the frontier from its binary string, after dropping the clear bits below its lowest cell. The
+            # string is highest bit first, so the cell for the character at index i is bit top - i.
+            lowest = (frontier & -frontier).bit_length() - 1
+            bits = bin(frontier >> lowest)
+            top = lowest + len(bits) - 1
+            i = bits.find('1', 2)
+            while i >= 0:
+                (y, x) = divmod(top - i, stride)
+                distances[y*width + x] = distance
+                i = bits.find('1', i + 1)
+
+            if frontier & end_bit:
+                break
+
+            spread = 0
+            for shift in shifts:
+                spread |= (frontier << shift) | (frontier >> shift)
+
+            frontier = spread & unvisited
+            unvisited ^= frontier
+            distance += 1
+
+        return distances
+
+    @staticmethod
+    def bidirectional_route(map: MapBase,
+                            start: (int, int),
+                            end: (int, int),
+                            allow_diagonal=False) -> [(int, int)]:
+        '''
+        Shortest route between two cells found by searching from both ends at once, always growing whichever
+        frontier is smaller by one whole level. The two searches meet roughly half way, so on open maps far fewer
+        cells are explored than by a flood from the start alone. No distance map is produced.
+
+        Args:
+            map: The map to search
+            start: First cell of the route
+            end: Last cell of the route
+            allow_diagonal: Include the diagonal neighbours
+
+        Returns: The positions along one shortest route (as for render()), or [] if the end cannot be reached
+        '''
+        if not map.can_move_here(end):
+            return []
+
+        width = map.width
+        start_index = start[1]*width + start[0]
+        end_index = end[1]*width + end[0]
+        if start_index == end_index:
+            return [start]
+
+        # Neighbours are read straight from the map rather than from its adjacency index, as building the index
+        # would visit every cell on the map however close together start and end are
+        dx_dy = MapBase._dx_dy(allow_diagonal)
+        can_move_here = map.can_move_here
+
+        parents = ({start_index: None}, {end_index: None})     # per side: cell -> the cell it was reached from
+        depths = ({start_index: 0}, {end_index: 0})
+        frontiers = ([start_index], [end_index])
+        while frontiers[0] and frontiers[1]:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            (own_parents, own_depths) = (parents[side], depths[side])
+            other_depths = depths[1 - side]
+
+            # Finish the whole level before choosing where to meet: the first meeting found may not be the shortest
+            meeting_index = None
+            next_frontier = []
+            for i in frontiers[side]:
+                depth = own_depths[i] + 1
+                (y, x) = divmod(i, width)
+                for (dx, dy) in dx_dy:
+                    j = i + dy*width + dx
+                    if j in own_parents or not can_move_here((x+dx, y+dy)):
+                        continue
+
+                    own_parents[j] = i
+                    own_depths[j] = depth
+                    next_frontier.append(j)
+                    if j in other_depths and (meeting_index is None or other_depths[j] < other_depths[meeting_index]):
+                        meeting_index = j
+
+            if meeting_index is not None:
+                route = []
+                i = meeting_index
+                while i is not None:
+                    route.append(i)
+                    i = parents[0][i]
+                route.reverse()
+                i = parents[1][meeting_index]
+                while i is not None:
+                    route.append(i)
+                    i = parents[1][i]
+                return [(i % width, i // width) for i in route]
+
+            frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+
+        return []
+
+    @staticmethod
+    def multi_source_distance_field(map: MapBase,
+                                    sources: [(int, int)],
+                                    allow_diagonal=False) -> (array, array):
+        '''
+        Breadth-first flood seeded from every source at once, giving the distance to the nearest source and which
+        source that is for every cell in a single pass. Where two sources are equally near, the cell goes to the one
+        whose flood reaches it first (earlier sources are expanded first).
+
+        Args:
+            map: The map to flood
+            sources: The cells with distance 0; their indexes in this list are the source ids
+            allow_diagonal: Include the diagonal neighbours
+
+        Returns: (distances, source_ids) - flat int32 arrays of width*height (index y*width + x), -1 where not reached
+        '''
+        width = map.width
+        distances = array('i', [-1]) * (width * map.height)
+        source_ids = array('i', [-1]) * (width * map.height)
+
+        cells = deque()
+        for (source_id, (x, y)) in enumerate(sources):
+            if distances[y*width + x] == -1:
+                distances[y*width + x] = 0
+                source_ids[y*width + x] = source_id
+                cells.append(y*width + x)
+
+        while cells:
+            i = cells.popleft()
+            distance = distances[i] + 1
+            for j in map.neighbour_indices(i, allow_diagonal):
+                if distances[j] == -1:
+                    distances[j] = distance
+                    source_ids[j] = source_ids[i]
+                    cells.append(j)
+
+        return distances, source_ids
+
+    @staticmethod
+    def nearest_location_field(map: MapBase, c: str, allow_diagonal=False) -> ([(int, int)], array, array):
+        '''
+        multi_source_distance_field() seeded from every cell containing c.
+
+        Returns: (locations of c, distances, source_ids), where source_ids index into the locations
+        '''
+        locations = map.find_locations(c)
+        (distances, source_ids) = MapSolver.multi_source_distance_field(map, locations, allow_diagonal)
+        return locations, distances, source_ids
+
+    def _open_neighbours(self, position: (int, int)) -> [(int, int)]:
+        return self._map.open_positions_around_position(position=position, allow_diagonal=self.allow_diagonal_movement)
+
     def is_dead_end(self, position: (int,int)) -> bool:
         (x,y) = position
         current_distance = self._distance_map[y][x]
-        possible_next_steps = self._map.open_positions_around_position(position=position, allow_diagonal=self.allow_diagonal_movement)
+        possible_next_steps = self._open_neighbours(position)
         possible_next_steps = [(x1, y1) for (x1, y1) in possible_next_steps if
                                self._distance_map[y1][x1] > current_distance]
         return len(possible_next_steps) == 0
@@ -88,7 +324,7 @@ class MapSolver:
         dead_ends:[(int,int)] = []
         for y in range(0, self._map.height):
             for x in range(0, self._map.width):
-                if self._map.map[y][x] == Map.WALL:
+                if self._map.get_location((x,y)) == Map.WALL:
                     continue
 
                 if (x,y) == self._map.end:  # don't count the end location as a dead-end.
@@ -99,21 +335,188 @@ class MapSolver:
 
         return dead_ends
 
-    def _purge_dead_ends(self, dead_end_position: (int,int)):
-        (x,y) = dead_end_position
-        self._distance_map[y][x] = -1
+    def purge_dead_ends(self):
+        '''
+        Remove (set the distance to -1) every cell that cannot lead on to a higher distance, i.e. every cell that is
+        not on a shortest route to the end. Each cell keeps a count of its neighbours with a higher distance; purging
+        a cell decrements the counts of its lower-distance neighbours and queues any that drop to 0, so the whole
+        map is pruned in a single linear pass.
+        '''
+        distance_map = self._distance_map
+        width = self._map.width
+        forward_counts = [0] * (width * self._map.height)
+        self._number_width = None
+
+        dead_ends = deque()
+        for y in range(0, self._map.height):
+            for x in range(0, width):
+                distance = distance_map[y][x]
+                if distance < 0:
+                    continue
 
-        possible_dead_ends = self._map.open_positions_around_position(dead_end_position)
-        possible_dead_ends = [(x1,y1) for (x1,y1) in possible_dead_ends if self._distance_map[y1][x1] >= 0]
-        for possible_dead_end in possible_dead_ends:
-            if self.is_dead_end(possible_dead_end):
-                self._purge_dead_ends(possible_dead_end)
+                forward_count = len([1 for (x1, y1) in self._open_neighbours((x, y)) if distance_map[y1][x1] > distance])
+                forward_counts[y*width + x] = forward_count
+                if forward_count == 0 and (x, y) != self._map.end:
+                    dead_ends.append((x, y))
+
+        while dead_ends:
+            (x, y) = dead_end = dead_ends.popleft()
+            distance = distance_map[y][x]
+            distance_map[y][x] = -1
+
+            for (x1, y1) in self._open_neighbours(dead_end):
+                if 0 <= distance_map[y1][x1] < distance:
+                    forward_counts[y1*width + x1] -= 1
+                    if forward_counts[y1*width + x1] == 0 and (x1, y1) != self._map.end:
+                        dead_ends.append((x1, y1))
+
+    def prune_to_shortest_routes(self,
+                                 start_position: Optional[Tuple[int, int]] = None,
+                                 end_position: Optional[Tuple[int, int]] = None):
+        '''
+        Reduce the distance map to the cells on a shortest route between any two positions (by default the map start
+        and end), ready for route enumeration. Unlike purge_dead_ends() this also removes cells that lead to the end
+        but cannot be reached from start_position.
+        '''
+        keep_positions = self.find_shortest_route_positions(start_position, end_position)
+        self._number_width = None
+        for y in range(0, self._map.height):
+            for x in range(0, self._map.width):
+                if (x, y) not in keep_positions:
+                    self._distance_map[y][x] = -1
+
+    def set_location(self, position: (int, int), c: str):
+        '''
+        Change a cell on the map and repair the distance map, rather than building a new solver. Opening a cell
+        floods outwards from it only as far as distances get shorter; adding a wall only recalculates the cells
+        whose every shortest route from the start went through it. Requires full_distance_field, as a distance map
+        that stopped at the end cannot tell which cells beyond it have become reachable.
+
+        Args:
+            position: The cell to change
+            c: The new character, e.g. Map.WALL or Map.PATH
+        '''
+        if not self.full_distance_field:
+            raise ValueError('Incremental updates need the full distance field, please use full_distance_field=True')
+        if position == self._map.start and c == Map.WALL:
+            raise ValueError(f'Cannot put a wall on the start {position}')
+
+        was_open = self._map.can_move_here(position)
+        self._map.set_location(position, c)
+        self._number_width = None
+        is_open = self._map.can_move_here(position)
+
+        if is_open and not was_open:
+            self._repair_opened_cell(position)
+        elif was_open and not is_open:
+            self._repair_closed_cell(position)
+
+    def _repair_opened_cell(self, position: (int, int)):
+        if not self.allow_movement_to(position):
+            return
 
-    def purge_dead_ends(self):
-        dead_ends = self.find_dead_ends()
+        distance_map = self._distance_map
+        distances = [distance_map[y][x] for (x, y) in self._open_neighbours(position) if distance_map[y][x] >= 0]
+        if not distances:
+            return
+
+        (x, y) = position
+        distance_map[y][x] = min(distances) + 1
+        positions = deque([position])
+        while positions:    # distances only ever grow by 1 from a single source, so a FIFO queue is enough
+            (x, y) = position = positions.popleft()
+            distance = distance_map[y][x] + 1
+            for (x1, y1) in self._open_neighbours(position):
+                if (distance_map[y1][x1] == -1 or distance_map[y1][x1] > distance) and \
+                        self.allow_movement_to((x1, y1)):
+                    distance_map[y1][x1] = distance
+                    positions.append((x1, y1))
+
+    def _repair_closed_cell(self, position: (int, int)):
+        distance_map = self._distance_map
+        (x, y) = position
+        if distance_map[y][x] < 0:
+            return
+
+        # Find the cells that have lost every neighbour one step closer to the start. The distances are only
+        # cleared afterwards, so that the old values can still be compared here.
+        lost_positions = {position}
+        positions = deque([position])
+        while positions:
+            (x, y) = position = positions.popleft()
+            next_distance = distance_map[y][x] + 1
+            for (x1, y1) in self._open_neighbours(position):
+                if distance_map[y1][x1] != next_distance or (x1, y1) in lost_positions:
+                    continue
+
+                if not [1 for (x2, y2) in self._open_neighbours((x1, y1))
+                        if distance_map[y2][x2] == next_distance - 1 and (x2, y2) not in lost_positions]:
+                    lost_positions.add((x1, y1))
+                    positions.append((x1, y1))
+
+        for (x, y) in lost_positions:
+            distance_map[y][x] = -1
+
+        # Re-flood the lost cells from whatever is left around them, nearest first
+        heap = []
+        for position in lost_positions:
+            distances = [distance_map[y][x] for (x, y) in self._open_neighbours(position) if distance_map[y][x] >= 0]
+            if distances and self._map.can_move_here(position) and self.allow_movement_to(position):
+                heappush(heap, (min(distances) + 1, position))
+
+        while heap:
+            (distance, position) = heappop(heap)
+            (x, y) = position
+            if 0 <= distance_map[y][x] <= distance:
+                continue
+
+            distance_map[y][x] = distance
+            for (x1, y1) in self._open_neighbours(position):
+                if (x1, y1) in lost_positions and distance_map[y1][x1] == -1 and self.allow_movement_to((x1, y1)):
+                    heappush(heap, (distance + 1, (x1, y1)))
+
+    def evaluate_shortcuts(self, min_saving: int = 1) -> Dict[Tuple[int, int], int]:
+        '''
+        Score every wall by how much shorter the route from start to end becomes if that one wall is removed. Rather
+        than re-solving the map once per wall, this floods the map once from the start and once from the end: the
+        best route through a removed wall is the closest neighbour to the start, the wall, then the closest
+        neighbour to the end.
+
+        Args:
+            min_saving: Only report walls that save at least this many steps
+
+        Returns: {wall position: steps saved}, or {wall position: length of the new route} if the end cannot be
+                 reached at all without removing a wall
+        '''
+        if type(self).allow_movement_to is not MapSolver.allow_movement_to:
+            raise ValueError(f'{type(self).__name__} overrides allow_movement_to(), which evaluate_shortcuts() '
+                             f'cannot honour')
+
+        width = self._map.width
+        (from_start, _) = MapSolver.multi_source_distance_field(self._map, [self._map.start],
+                                                                allow_diagonal=self.allow_diagonal_movement)
+        (to_end, _) = MapSolver.multi_source_distance_field(self._map, [self._map.end],
+                                                            allow_diagonal=self.allow_diagonal_movement)
+        (end_x, end_y) = self._map.end
+        current_distance = from_start[end_y*width + end_x]
+
+        shortcuts = {}
+        for (x, y) in self._map.find_locations(Map.WALL):
+            neighbours = [(x+dx, y+dy) for (dx, dy) in MapBase._dx_dy(self.allow_diagonal_movement)
+                          if self._map.can_move_here((x+dx, y+dy))]
+            distances_from_start = [from_start[y1*width + x1] for (x1, y1) in neighbours
+                                    if from_start[y1*width + x1] >= 0]
+            distances_to_end = [to_end[y1*width + x1] for (x1, y1) in neighbours
+                                if to_end[y1*width + x1] >= 0]
+            if not distances_from_start or not distances_to_end:
+                continue
+
+            distance = min(distances_from_start) + 2 + min(distances_to_end)
+            saving = current_distance - distance if current_distance >= 0 else distance
+            if current_distance < 0 or saving >= min_saving:
+                shortcuts[(x, y)] = saving
 
-        for dead_end in dead_ends:
-            self._purge_dead_ends(dead_end_position=dead_end)
+        return shortcuts
 
     def find_shortest_route_distance(self, allow_diagonal=False) -> int:
         (end_x, end_y) = self._map.end
@@ -128,8 +531,7 @@ class MapSolver:
 
         current_distance = self._distance_map[y0][x0]
 
-        possible_next_positions = self._map.open_positions_around_position(position=position,
-                                                                           allow_diagonal=self.allow_diagonal_movement)
+        possible_next_positions = self._open_neighbours(position)
 
         next_positions = []
         for next_pos in possible_next_positions:
@@ -154,118 +556,207 @@ class MapSolver:
     def find_all_shortest_routes(self,
                                  start_position: Optional[Tuple[int, int]] = None,  #  x,   y,   d
                                  end_position: Optional[Tuple[int, int]] = None) -> [[((int, int), int)]]:
+        return list(self.iter_shortest_routes(start_position, end_position))
+
+    def _count_routes_to(self, end_position: (int, int)) -> Dict[Tuple[int, int], int]:
+        '''
+        Walk backwards from the end, one distance at a time, counting how many shortest routes lead from each cell
+        to the end (dynamic programming over the distance map). Only cells that are on a route to the end are
+        visited, so dead-ends do not need to be purged first.
+
+        Args:
+            end_position: The cell the routes lead to
+
+        Returns: {position: number of routes from position to end_position}, only for cells with at least one route
+        '''
+        (end_x, end_y) = end_position
+        distance = self._distance_map[end_y][end_x]
+        if distance < 0:
+            return {}
+
+        route_counts = {end_position: 1}
+        positions = [end_position]
+        while positions and distance > 0:
+            distance -= 1
+            previous_positions = []
+            for position in positions:
+                for (x, y) in self._open_neighbours(position):
+                    if self._distance_map[y][x] == distance:
+                        if (x, y) not in route_counts:
+                            route_counts[(x, y)] = 0
+                            previous_positions.append((x, y))
+                        route_counts[(x, y)] += route_counts[position]
+            positions = previous_positions
+
+        return route_counts
+
+    def count_shortest_routes(self,
+                              start_position: Optional[Tuple[int, int]] = None,
+                              end_position: Optional[Tuple[int, int]] = None) -> int:
+        '''
+        Count the shortest routes without building them, i.e. len(find_all_shortest_routes()) in linear time.
+        '''
         if start_position is None: start_position = self._map.start
         if end_position is None: end_position = self._map.end
 
         if start_position == end_position:
-            return []
+            return 0
+
+        return self._count_routes_to(end_position).get(start_position, 0)
+
+    def find_shortest_route_positions(self,
+                                      start_position: Optional[Tuple[int, int]] = None,
+                                      end_position: Optional[Tuple[int, int]] = None) -> Set[Tuple[int, int]]:
+        '''
+        Find every cell that is on at least one shortest route (e.g. to count the cells or render them as an overlay).
+        '''
+        if start_position is None: start_position = self._map.start
+        if end_position is None: end_position = self._map.end
+
+        route_counts = self._count_routes_to(end_position)
+        if start_position == end_position or start_position not in route_counts:
+            return set()
+
+        positions = {start_position}
+        next_positions = [start_position]
+        while next_positions:
+            position = next_positions.pop()
+            for next_position in self._find_next_positions(position):
+                if next_position in route_counts and next_position not in positions:
+                    positions.add(next_position)
+                    next_positions.append(next_position)
+
+        return positions
+
+    def iter_shortest_routes(self,
+                             start_position: Optional[Tuple[int, int]] = None,  #  x,   y,   d
+                             end_position: Optional[Tuple[int, int]] = None) -> Iterator[[((int, int), int)]]:
+        '''
+        Generate the shortest routes one at a time, in the same order and form as find_all_shortest_routes(). A single
+        route is extended and cut back as the search moves between branches, so routes share their common prefix and
+        only the route being yielded is copied. Branches that cannot reach the end are never entered.
+        '''
+        if start_position is None: start_position = self._map.start
+        if end_position is None: end_position = self._map.end
+
+        route_counts = self._count_routes_to(end_position)
+        if start_position == end_position or start_position not in route_counts:
+            return
+
+        def next_positions_on_route(position: (int, int)) -> Iterator[Tuple[int, int]]:
+            return iter([p for p in self._find_next_positions(position) if p in route_counts])
+
+        route = [self._create_route_step(start_position)]
+        branches = [next_positions_on_route(start_position)]
+        while branches:
+            position = next(branches[-1], None)
+            if position is None:        # all routes through this step have been generated, step back
+                branches.pop()
+                route.pop()
+                continue
 
-        current_route = []  # this part of the recursion will start with only a section of non-branching steps
-        position = start_position
-        while True:
-            if position == end_position:        # if we hit the end, simply return this non-branching section
-                current_route.append(self._create_route_step(position))
-                return [current_route]
-
-            next_positions = self._find_next_positions(position)  # Look for the next possible steps
-            assert len(next_positions) != 0                       # We do not expect dead-ends!!!
-
-            if len(next_positions) == 1:                          # No branch: simply extend the non-branching section
-                current_route.append(self._create_route_step(position))
-                position = next_positions[0]
-            else:                                                 # Branch: recurse to locate all subsequent route
-                current_route.append(self._create_route_step(position))
-                routes = []                                       # combinations, store them and return them
-                for next_position in next_positions:
-                    additional_routes = self.find_all_shortest_routes(next_position, end_position)
-                    for additional_route in additional_routes:
-                        routes.append(current_route + additional_route)
-                return routes
+            route.append(self._create_route_step(position))
+            if position == end_position:
+                yield list(route)
+                route.pop()
+            else:
+                branches.append(next_positions_on_route(position))
 
     def find_all_routes(self,
                         start_position: Optional[Tuple[int, int]] = None,  #  x,   y,   d
                         end_position: Optional[Tuple[int, int]] = None,
                         visited_positions: Optional[Tuple[int,int]] = None) -> [[((int, int), int)]]:
+        return list(self.iter_all_routes(start_position, end_position, exclude_positions=visited_positions))
+
+    def _iter_junction_paths(self,
+                             start_position: Optional[Tuple[int, int]],
+                             end_position: Optional[Tuple[int, int]],
+                             exclude_positions: Optional[Tuple[int,int]]) -> Iterator[[[(int, int)]]]:
+        '''
+        Every simple path from start to end through the JunctionGraph of the map, as lists of corridors (see
+        JunctionGraph.iter_paths()).
+        '''
         if start_position is None: start_position = self._map.start
         if end_position is None: end_position = self._map.end
-        if visited_positions is None: visited_positions = []
 
-        if start_position == end_position:
+        exclude_positions = set(exclude_positions) - {start_position} if exclude_positions else set()
+        graph = JunctionGraph(self._map,
+                              allow_diagonal=self.allow_diagonal_movement,
+                              extra_nodes=[start_position, end_position],
+                              exclude_positions=exclude_positions)
+        if start_position not in graph.node_ids or end_position not in graph.node_ids:
+            return iter([])
+
+        return graph.iter_paths(start_position, end_position)
+
+    def iter_all_routes(self,
+                        start_position: Optional[Tuple[int, int]] = None,  #  x,   y,   d
+                        end_position: Optional[Tuple[int, int]] = None,
+                        exclude_positions: Optional[Tuple[int,int]] = None) -> Iterator[[((int, int), int)]]:
+        '''
+        Generate every route from start to end that does not visit a cell twice, in the same order and form as
+        find_all_routes(). The search runs over the JunctionGraph of the map, so it only branches at junctions and
+        never recurses.
+
+        Args:
+            start_position: defaults to the map start
+            end_position: defaults to the map end
+            exclude_positions: cells the routes may not use
+        '''
+        if start_position is None: start_position = self._map.start
+
+        for corridors in self._iter_junction_paths(start_position, end_position, exclude_positions):
+            route = [self._create_route_step(start_position)]
+            for corridor in corridors:
+                route.extend([self._create_route_step(position) for position in corridor])
+            yield route
+
+    def find_longest_route(self,
+                           start_position: Optional[Tuple[int, int]] = None,  #  x,   y,   d
+                           end_position: Optional[Tuple[int, int]] = None,
+                           exclude_positions: Optional[Tuple[int,int]] = None) -> [((int, int), int)]:
+        '''
+        Find the longest route from start to end that does not visit a cell twice. Only the corridor lengths are
+        summed during the search; the route itself is only built for the winner.
+
+        Returns: The longest route, or [] if there is no route
+        '''
+        if start_position is None: start_position = self._map.start
+
+        longest_length = -1
+        longest_corridors = []
+        for corridors in self._iter_junction_paths(start_position, end_position, exclude_positions):
+            length = sum([len(corridor) for corridor in corridors])
+            if length > longest_length:
+                longest_length = length
+                longest_corridors = list(corridors)
+
+        if longest_length < 0:
             return []
 
-        current_route = []  # this part of the recursion will start with only a section of non-branching steps
-        position = start_position
-        while True:
-            visited_positions.append(position)
-
-            if position == end_position:        # if we hit the end, simply return this non-branching section
-                current_route.append(self._create_route_step(position))
-                return [current_route]
-
-            next_positions = self._find_next_positions(position, # Look for the next possible steps
-                                                       exclude_positions=visited_positions,
-                                                       follow_all_paths=True)
-            if len(next_positions) == 0:  # dead-end, return empty routes
-                return []
-
-            if len(next_positions) == 1:                          # No branch: simply extend the non-branching section
-                current_route.append(self._create_route_step(position))
-                position = next_positions[0]
-            else:                                                 # Branch: recurse to locate all subsequent route
-                current_route.append(self._create_route_step(position))
-                routes = []                                       # combinations, store them and return them
-                for next_position in next_positions:
-                    additional_routes = self.find_all_routes(next_position,
-                                                             end_position,
-                                                             copy.copy(visited_positions))
-                    for additional_route in additional_routes:
-                        routes.append(current_route + additional_route)
-                return routes
-
-    def _max_number_width(self):
-        return max([max([len(str(d)) for d in row]) for row in self._distance_map])
-
-    def _is_populated(self, o: int):
-        return o >= 0
+        route = [self._create_route_step(start_position)]
+        for corridor in longest_corridors:
+            route.extend([self._create_route_step(position) for position in corridor])
+        return route
 
     def render(self,
                overlay_route: Optional[Tuple[int,int]] = None,
                overlay_shortcut: Optional[list[Tuple[int,int]]] = None,
                top_left: Optional[Tuple[int,int]] = None,
-               bottom_right: Optional[Tuple[int,int]] = None):
-        distance_map = self._distance_map
-        max_number_width = self._max_number_width()
-
-        if overlay_route and isinstance(overlay_route[0][0],tuple):
-            overlay_route = [p for (p,d)  in overlay_route]
-        if overlay_shortcut and isinstance(overlay_shortcut[0][0],tuple):
-            overlay_shortcut = [p for (p,d)  in overlay_shortcut]
-
-        x_min = 0
-        x_max = self.map.width
-        y_min = 0
-        y_max = self.map.height
-
-        if top_left:
-            (x_min, y_min) = top_left
-
-        if bottom_right:
-            (x_max, y_max) = bottom_right
-
-        shortcut_locations = [position for (position, distance) in overlay_shortcut] if overlay_shortcut else []
-        for y in range(y_min, y_max):
-            for x in range(x_min, x_max):
-                if self._map.map[y][x] == Map.WALL:
-                    print(f'{Map.WALL * (max_number_width + 2)} ', end='')
-                elif overlay_route and (x, y) in overlay_route:
-                    print(f'{"O" * (max_number_width + 2)} ', end='')
-                elif not self._is_populated(self._distance_map[y][x]):
-                    print(f'{"X"*(max_number_width+2)} ', end='')
-                elif overlay_shortcut and (x,y) in shortcut_locations:
-                    print(f'{"*"*(max_number_width+2)} ', end='')
-                else:
-                    print(f'[{str(distance_map[y][x]): >{max_number_width}}] ',end='')
-            print('')
+               bottom_right: Optional[Tuple[int,int]] = None,
+               stream: Optional[TextIO] = None):
+        if self._number_width is None:
+            self._number_width = MapRenderer.number_width(self._distance_map)
+
+        renderer = MapRenderer(self._map, self._distance_map, self._number_width)
+        renderer.write(renderer.distance_frame(overlay_route, overlay_shortcut, top_left, bottom_right), stream)
+
+    def render_preview(self,
+                       max_width: int = 120,
+                       max_height: int = 60,
+                       overlay_route: Optional[Tuple[int,int]] = None,
+                       stream: Optional[TextIO] = None):
+        self._map.render_preview(max_width, max_height, overlay_route, stream)
 
 
 if __name__ == '__main__':
@@ -281,14 +772,85 @@ if __name__ == '__main__':
     solver.render()
     shortest_routes = solver.find_all_shortest_routes()
     assert len(shortest_routes) == 4
+    assert solver.count_shortest_routes() == 4
+    assert solver.find_shortest_route_positions() == {p for route in shortest_routes for (p, d) in route}
+    unpurged_solver = MapSolver(MapWithStartAndEnd('test_map_2.txt'))
+    assert list(unpurged_solver.iter_shortest_routes()) == shortest_routes
+    unpurged_solver.prune_to_shortest_routes()
+    assert unpurged_solver.distance_map == solver.distance_map
     for route in shortest_routes:
         print('')
         solver.render(overlay_route=route)
     solver.find_shortest_route_distance()
 
+    compact_solver = MapSolver(CompactMapWithStartAndEnd('test_map_2.txt'))
+    compact_solver.purge_dead_ends()
+    assert compact_solver.distance_map == solver.distance_map
+
+    for test_file in ['test_map.txt', 'test_map_2.txt']:
+        for allow_diagonal in [False, True]:
+            for full_distance_field in [False, True]:
+                bfs_solver = MapSolver(MapWithStartAndEnd(test_file),
+                                       allow_diagonal_movement=allow_diagonal,
+                                       full_distance_field=full_distance_field)
+                bitmask_solver = MapSolver(MapWithStartAndEnd(test_file),
+                                           allow_diagonal_movement=allow_diagonal,
+                                           use_bitmask_bfs=True,
+                                           full_distance_field=full_distance_field)
+                assert bitmask_solver.distance_map == bfs_solver.distance_map
+
+    incremental_solver = MapSolver(MapWithStartAndEnd('test_map.txt'), full_distance_field=True)
+    for (position, c) in [((3, 2), Map.WALL), ((7, 7), Map.WALL), ((3, 2), Map.PATH), ((8, 3), Map.PATH),
+                          ((6, 1), Map.PATH), ((7, 7), Map.PATH)]:
+        incremental_solver.set_location(position, c)
+        assert incremental_solver.distance_map == MapSolver(incremental_solver.map, full_distance_field=True).distance_map
+
+    # A repair only revisits cells near the change: nothing map-wide (such as the adjacency index) is rebuilt
+    open_map = MapBase()
+    open_map.populate_empty_map(200, 200)
+    open_map.start = (0, 0)
+    open_solver = MapSolver(open_map, full_distance_field=True)
+    adjacency = open_map._adjacency[False]
+    visited = []
+    open_neighbours = open_solver._open_neighbours
+    open_solver._open_neighbours = lambda position: visited.append(position) or open_neighbours(position)
+    for position in [(50, 60), (120, 30), (150, 150), (10, 190)]:
+        open_solver.set_location(position, Map.WALL)
+        open_solver.set_location(position, Map.PATH)
+    assert open_map._adjacency[False] is adjacency
+    assert len(visited) < 100   # of the 40,000 cells
+    assert open_solver.distance_map == MapSolver(open_map, full_distance_field=True).distance_map
+
+    shortcuts = MapSolver(MapWithStartAndEnd('test_map.txt')).evaluate_shortcuts()
+    for (position, saving) in shortcuts.items():
+        shortcut_map = MapWithStartAndEnd('test_map.txt')
+        shortcut_map.set_location(position, Map.PATH)
+        assert MapSolver(shortcut_map).find_shortest_route_distance() == 84 - saving
+
+    map = MapWithStartAndEnd('test_map.txt')
+    route = MapSolver.bidirectional_route(map, map.start, map.end)
+    assert len(route) == 85 and route[0] == map.start and route[-1] == map.end
+    assert not map._adjacency   # a point to point search does not index the whole map
+
+    (locations, distances, source_ids) = MapSolver.nearest_location_field(map, 'E')
+    assert locations == [map.end]
+    assert distances.tolist() == MapSolver.bitmask_distance_field(map, map.end).tolist()
+    (distances, source_ids) = MapSolver.multi_source_distance_field(map, [map.start, map.end])
+    assert source_ids[map.start[1]*map.width + map.start[0]] == 0
+    assert source_ids[map.end[1]*map.width + map.end[0]] == 1
+
+    frame = io.StringIO()
+    solver.render(overlay_route=shortest_routes[0], top_left=(1, 7), bottom_right=(4, 8), stream=frame)
+    assert frame.getvalue() == 'OOOO OOOO OOOO \n'
+    assert solver._number_width == MapRenderer.number_width(solver.distance_map)    # kept for the next render()
+    frame = io.StringIO()
+    solver.map.render_preview(max_width=11, max_height=9, overlay_route=shortest_routes[0], stream=frame)
+    assert frame.getvalue().splitlines()[3] == 'OOOOOOOOOO#'
+
     print('=================== All Routes ====================')
     all_routes = solver.find_all_routes()
     assert len(all_routes) == 8
+    assert max([len(route) for route in all_routes]) == len(solver.find_longest_route())
     for route in all_routes:
         print('')
         solver.render(overlay_route=route)
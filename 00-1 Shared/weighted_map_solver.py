@@ -0,0 +1,236 @@
+from map import MapBase, MapWithStartAndEnd
+from map_solver import MapSolver
+from direction_mapper import DirectionMapper
+from heapq import heappush, heappop
+from itertools import count
+from typing import Optional, Tuple, Dict
+
+
+class CostModel:
+    '''
+    Describes what a move costs for WeightedMapSolver. A move from one cell to a neighbour costs the step (or diagonal)
+    cost, plus the cost of entering the new cell (looked up by map character in cell_costs), plus turn_cost for every
+    90 degrees the heading changes (45 degree changes, only possible with diagonal moves, cost half).
+
+    Subclass and override cell_cost() for terrain that depends on more than the character on the map. All costs
+    must be >= 0.
+    '''
+    # Headings in clockwise order, starting North, so the distance between two indexes is the number of 45 degree turns
+    HEADINGS = [(0,-1), (1,-1), (1,0), (1,1), (0,1), (-1,1), (-1,0), (-1,-1)]
+    _HEADING_INDEX = {heading: i for i, heading in enumerate(HEADINGS)}
+
+    def __init__(self,
+                 step_cost: float = 1,
+                 diagonal_cost: Optional[float] = None,
+                 turn_cost: float = 0,
+                 cell_costs: Optional[Dict[str, float]] = None):
+        self.step_cost = step_cost
+        self.diagonal_cost = step_cost if diagonal_cost is None else diagonal_cost
+        self.turn_cost = turn_cost
+        self.cell_costs = cell_costs if cell_costs is not None else {}
+
+        if min([self.step_cost, self.diagonal_cost, self.turn_cost] + list(self.cell_costs.values())) < 0:
+            raise ValueError('Costs must not be negative')
+
+    @property
+    def has_turn_cost(self) -> bool:
+        return self.turn_cost != 0
+
+    def cell_cost(self, map: MapBase, position: (int, int)) -> float:
+        return self.cell_costs.get(map.get_location(position), 0)
+
+    def move_cost(self, map: MapBase, from_position: (int, int), to_position: (int, int)) -> float:
+        (x0, y0) = from_position
+        (x1, y1) = to_position
+        step_cost = self.step_cost if x0 == x1 or y0 == y1 else self.diagonal_cost
+        return step_cost + self.cell_cost(map, to_position)
+
+    def turning_cost(self, from_heading: Optional[Tuple[int, int]], to_heading: (int, int)) -> float:
+        if from_heading is None or from_heading == to_heading:
+            return 0
+
+        turns = abs(CostModel._HEADING_INDEX[from_heading] - CostModel._HEADING_INDEX[to_heading])
+        return self.turn_cost * min(turns, 8 - turns) / 2    # turns counts 45 degree steps
+
+    def min_move_cost(self, allow_diagonal: bool) -> float:
+        '''
+        The cheapest possible single move, used to scale the A* heuristics so they never overestimate.
+        '''
+        return min(self.step_cost, self.diagonal_cost) if allow_diagonal else self.step_cost
+
+
+class WeightedMapSolver:
+    '''
+    Shortest route from start to end when moves have different costs (see CostModel). This is a heap-based Dijkstra
+    search, or A* when a heuristic is given, that stops as soon as the end is reached. With a turn cost the search
+    state is (position, heading) rather than just the position.
+
+    cost_map mirrors MapSolver.distance_map: the lowest cost found for each cell that the search settled, else -1.
+    '''
+    HEURISTICS = {
+        'manhattan': lambda dx, dy: dx + dy,
+        'chebyshev': lambda dx, dy: max(dx, dy),
+    }
+
+    def __init__(self, map: MapBase,
+                 cost_model: Optional[CostModel] = None,
+                 allow_diagonal_movement=False,
+                 heuristic: Optional[str] = None,
+                 start_heading: Optional[str] = None,
+                 full_cost_field=False):
+        '''
+        Args:
+            map: The map to solve
+            cost_model: The cost of each move, defaults to 1 per step (the same answer as MapSolver)
+            allow_diagonal_movement: Allow moves to the 4 diagonal neighbours as well as N, E, S and W
+            heuristic: None for Dijkstra, or 'manhattan'/'chebyshev' for A*. Use 'chebyshev' with diagonal movement.
+            start_heading: The direction (N/E/S/W or ^/>/v/<) faced at the start, so the first move can incur a turn
+                           cost. None means the first move is free to go in any direction.
+            full_cost_field: Keep searching after the end is reached until every reachable cell has a cost
+        '''
+        if heuristic is not None and heuristic not in WeightedMapSolver.HEURISTICS:
+            raise ValueError(f'Unknown heuristic {heuristic}, please use one of {list(WeightedMapSolver.HEURISTICS)}')
+        if heuristic == 'manhattan' and allow_diagonal_movement:
+            raise ValueError('The manhattan heuristic overestimates with diagonal movement, please use chebyshev')
+        if heuristic is not None and full_cost_field:
+            raise ValueError('A heuristic only helps to reach the end, it cannot be used for the full cost field')
+        if heuristic is not None and map.end is None:
+            raise ValueError('A heuristic needs the map to have an end to estimate the remaining cost to')
+
+        self._map = map
+        self.cost_model = cost_model if cost_model is not None else CostModel()
+        self.allow_diagonal_movement = allow_diagonal_movement
+        self.heuristic = heuristic
+        self.start_heading = DirectionMapper.find_dx_dy(start_heading) if start_heading is not None else None
+        self.full_cost_field = full_cost_field or map.end is None
+
+        self._cost_map = [[-1 for x in range(0, map.width)] for y in range(0, map.height)]
+        self._best_costs = {}   # (position, heading) -> lowest cost found
+        self._came_from = {}    # (position, heading) -> previous (position, heading)
+        self._end_state = None
+        self._search()
+
+    @property
+    def map(self):
+        return self._map
+
+    @property
+    def cost_map(self) -> [[float]]:
+        return self._cost_map
+
+    def allow_movement_to(self, to_position: (int, int)):
+        """
+        This function may be overridden by more complex solver classes
+
+        :param to_position: The position we are trying to move to.
+        :return: True if allowed to move to the location
+        """
+        return True
+
+    def _estimate_remaining_cost(self, position: (int, int)) -> float:
+        if self.heuristic is None:
+            return 0
+
+        (x, y) = position
+        (end_x, end_y) = self._map.end
+        distance = WeightedMapSolver.HEURISTICS[self.heuristic](abs(end_x - x), abs(end_y - y))
+        return distance * self.cost_model.min_move_cost(self.allow_diagonal_movement)
+
+    def _search(self):
+        cost_model = self.cost_model
+        track_heading = cost_model.has_turn_cost
+        tie_breaker = count()  # keeps the heap from ever comparing positions/headings
+
+        start_state = (self._map.start, self.start_heading if track_heading else None)
+        self._best_costs[start_state] = 0
+        heap = [(self._estimate_remaining_cost(self._map.start), 0, next(tie_breaker), start_state)]
+        while heap:
+            (_, cost, _, state) = heappop(heap)
+            if cost > self._best_costs[state]:  # stale entry, a cheaper way here has already been expanded
+                continue
+
+            (position, heading) = state
+            (x, y) = position
+            if self._cost_map[y][x] == -1:
+                self._cost_map[y][x] = cost
+
+            if position == self._map.end and self._end_state is None:
+                self._end_state = state
+                if not self.full_cost_field:
+                    break
+
+            for next_position in self._map.open_positions_around_position(position=position,
+                                                                          allow_diagonal=self.allow_diagonal_movement):
+                if not self.allow_movement_to(next_position):
+                    continue
+
+                next_cost = cost + cost_model.move_cost(self._map, position, next_position)
+                next_heading = None
+                if track_heading:
+                    next_heading = (next_position[0] - x, next_position[1] - y)
+                    next_cost += cost_model.turning_cost(heading, next_heading)
+
+                next_state = (next_position, next_heading)
+                if next_cost < self._best_costs.get(next_state, float('inf')):
+                    self._best_costs[next_state] = next_cost
+                    self._came_from[next_state] = state
+                    heappush(heap, (next_cost + self._estimate_remaining_cost(next_position),
+                                    next_cost, next(tie_breaker), next_state))
+
+    def find_shortest_route_cost(self) -> float:
+        '''
+        Returns: The lowest cost from start to end, or -1 if the end cannot be reached
+        '''
+        return self._best_costs[self._end_state] if self._end_state is not None else -1
+
+    def find_shortest_route(self) -> [((int, int), float)]:
+        '''
+        Returns: One lowest cost route as a list of (position, cost so far) steps, in the same form as the routes from
+                 MapSolver.find_all_shortest_routes() (so it can be passed to MapSolver.render()), or [] if the end
+                 cannot be reached
+        '''
+        route = []
+        state = self._end_state
+        while state is not None:
+            route.append((state[0], self._best_costs[state]))
+            state = self._came_from.get(state)
+
+        return list(reversed(route))
+
+
+if __name__ == '__main__':
+    for test_file in ['test_map.txt', 'test_map_2.txt']:
+        for allow_diagonal in [False, True]:
+            bfs_solver = MapSolver(MapWithStartAndEnd(test_file), allow_diagonal_movement=allow_diagonal)
+            for heuristic in [None, 'chebyshev'] + ([] if allow_diagonal else ['manhattan']):
+                solver = WeightedMapSolver(MapWithStartAndEnd(test_file),
+                                           allow_diagonal_movement=allow_diagonal,
+                                           heuristic=heuristic)
+                assert solver.find_shortest_route_cost() == bfs_solver.find_shortest_route_distance()
+                route = solver.find_shortest_route()
+                assert route[0][0] == solver.map.start and route[-1][0] == solver.map.end
+                assert len(route) == solver.find_shortest_route_cost() + 1
+
+    # Turning is expensive: the route through test_map_2.txt with the fewest turns wins
+    turn_model = CostModel(turn_cost=1000)
+    dijkstra = WeightedMapSolver(MapWithStartAndEnd('test_map_2.txt'), cost_model=turn_model, start_heading='E')
+    a_star = WeightedMapSolver(MapWithStartAndEnd('test_map_2.txt'), cost_model=turn_model, start_heading='E',
+                               heuristic='manhattan')
+    assert dijkstra.find_shortest_route_cost() == a_star.find_shortest_route_cost() == 8022
+    route = dijkstra.find_shortest_route()
+    assert route[-1] == (dijkstra.map.end, 8022)
+    assert len(route) == 23
+
+    # Terrain: every route through test_map.txt has to cross the expensive cell at (3,1)
+    terrain_map = MapWithStartAndEnd('test_map.txt')
+    terrain_map.set_location((3, 1), '~')
+    terrain = WeightedMapSolver(terrain_map, cost_model=CostModel(cell_costs={'~': 100}))
+    assert terrain.find_shortest_route_cost() == MapSolver(MapWithStartAndEnd('test_map.txt')).find_shortest_route_distance() + 100
+
+    no_end_map = MapWithStartAndEnd('test_map.txt')
+    no_end_map.end = None
+    try:
+        WeightedMapSolver(no_end_map, heuristic='manhattan')
+        assert False
+    except ValueError:
+        pass
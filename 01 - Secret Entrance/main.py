@@ -11,28 +11,65 @@
     passes '0' ten times.
 '''
 
+import sys
 from math import floor
-from typing import Tuple, List
+from itertools import accumulate
+from typing import Tuple, List, Optional, Iterator
 
 class SecretEntrance:
     SAFE_COMBINATIONS=100
     INITIAL_NUMBER=50
     DIRECTION={'L':-1, 'R':1}
+    CHUNK_SIZE=1 << 20  # bytes of instructions parsed at a time by calc_batch()
+    _SIGNED=bytes.maketrans(b'LR', b'-+')
 
-    def __init__(self, filepath: str):
+    def __init__(self, filepath: str, streaming: bool = False):
         '''
         Load the instruction file (e.g. L10, R1005) to prepare for the calculation.
 
-        :param filepath: path of the instruction file
+        :param filepath: path of the instruction file, or '-' for stdin (so instructions can be piped in)
+        :param streaming: don't load the instructions, read them as they are needed. Both answers are then worked out
+                          together in a single pass the first time either is asked for, so the file is only read once
+                          and never held in memory.
         '''
-        self.instructions: List[Tuple[str, int]] = []
+        self.filepath = filepath
+        self.streaming = streaming
+        self._results: Optional[Tuple[int, int]] = None
+        self.instructions: Optional[List[Tuple[str, int]]] = None
 
-        with open(filepath, 'r') as f:
-            self.instructions.extend([(line[0], int(line.strip()[1:]))
-                                      for line in f.readlines() if len(line.strip()) > 0])
+        if not streaming:
+            self.instructions = list(SecretEntrance.read_instructions(filepath))
 
+    @staticmethod
+    def read_instructions(filepath: str) -> Iterator[Tuple[str, int]]:
+        '''
+        Generator of (direction, amount) instructions, read one line at a time.
+
+        :param filepath: path of the instruction file, or '-' for stdin
+        '''
+        f = sys.stdin if filepath == '-' else open(filepath, 'r')
+        try:
+            for line in f:
+                line = line.strip()
+                if len(line) > 0:
+                    yield line[0], int(line[1:])
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+    def _calc_streaming(self) -> Tuple[int, int]:
+        if self._results is None:
+            dial = Dial()
+            for (direction, amount) in SecretEntrance.read_instructions(self.filepath):
+                dial.turn(direction, amount)
+            self._results = (dial.stops, dial.passes)
+
+        return self._results
 
     def calc_part1(self):
+        if self.streaming:
+            return self._calc_streaming()[0]
+
         n = SecretEntrance.INITIAL_NUMBER
         cnt = 0
         for (direction, amount) in self.instructions:
@@ -44,13 +81,16 @@ class SecretEntrance:
         return cnt
 
     @staticmethod
-    def _calc_count_v2(n: int, direction: str, amount: int) -> int:
+    def _calc_count_v2(n: int, direction: str, amount: int, safe_combinations: int = SAFE_COMBINATIONS) -> int:
         if direction == 'R':
-            return floor((n + amount) // SecretEntrance.SAFE_COMBINATIONS)
+            return floor((n + amount) // safe_combinations)
         else:
-            return floor(((SecretEntrance.SAFE_COMBINATIONS - n) % SecretEntrance.SAFE_COMBINATIONS + amount) // SecretEntrance.SAFE_COMBINATIONS)
+            return floor(((safe_combinations - n) % safe_combinations + amount) // safe_combinations)
 
     def calc_part2(self):
+        if self.streaming:
+            return self._calc_streaming()[1]
+
         n = SecretEntrance.INITIAL_NUMBER
 
         cnt = 0
@@ -60,6 +100,83 @@ class SecretEntrance:
             n = (n + (SecretEntrance.DIRECTION[direction]*amount)) % SecretEntrance.SAFE_COMBINATIONS
         return cnt
 
+    @staticmethod
+    def _parse_chunk(chunk: bytes) -> List[int]:
+        '''
+        Turn a block of instructions (e.g. b'L10\nR1005\n') into signed amounts (e.g. [-10, 1005]) by rewriting L/R as
+        a sign and letting int() parse the whole block.
+        '''
+        return [int(amount) for amount in chunk.translate(SecretEntrance._SIGNED).split()]
+
+    @staticmethod
+    def _count_moves(n: int, moves: List[int], safe_combinations: int) -> Tuple[int, int, int]:
+        '''
+        Apply a list of signed moves to the dial. Rather than stepping the dial, the positions are a running total
+        (not wrapped), so the number of times 0 is passed or landed on by a move is just the change in the number of
+        whole turns: floor(p/N) moving right, or floor((p-1)/N) moving left since the start point does not count.
+
+        Args:
+            n: The number the dial starts on (0 <= n < safe_combinations)
+            moves: Signed amounts, negative for L and positive for R
+            safe_combinations: The number of positions on the dial
+
+        Returns: (number the dial ends on, times it stopped on 0, times it passed or stopped on 0)
+        '''
+        positions = list(accumulate(moves, initial=n))
+        stops = sum([1 for p in positions[1:] if p % safe_combinations == 0])
+        passes = sum([(p1 // safe_combinations) - (p0 // safe_combinations) if p1 > p0 else
+                      ((p0 - 1) // safe_combinations) - ((p1 - 1) // safe_combinations)
+                      for (p0, p1) in zip(positions, positions[1:])])
+        return positions[-1] % safe_combinations, stops, passes
+
+    @staticmethod
+    def calc_batch(filepath: str,
+                   safe_combinations: int = SAFE_COMBINATIONS,
+                   initial_number: int = INITIAL_NUMBER,
+                   chunk_size: int = CHUNK_SIZE) -> Tuple[int, int]:
+        '''
+        Calculate both answers for an instruction file of any size, for any dial. The file is read and parsed in
+        blocks of roughly chunk_size bytes (always whole lines), carrying the dial position from one block to the next,
+        so memory use does not grow with the file.
+
+        Returns: (answer 1, answer 2)
+        '''
+        n = initial_number
+        part1 = part2 = 0
+        with open(filepath, 'rb') as f:
+            while True:
+                lines = f.readlines(chunk_size)
+                if not lines:
+                    break
+
+                (n, stops, passes) = SecretEntrance._count_moves(n, SecretEntrance._parse_chunk(b''.join(lines)),
+                                                                 safe_combinations)
+                part1 += stops
+                part2 += passes
+
+        return part1, part2
+
     def display_results(self):
         print(f'Answer 1: {self. calc_part1()}')
-        print(f'Answer 2: {self. calc_part2()}')
\ No newline at end of file
+        print(f'Answer 2: {self. calc_part2()}')
+
+
+class Dial:
+    '''
+    The state of the safe dial as instructions are applied one at a time, keeping the counts for both parts so they
+    can be worked out in a single pass over the instructions.
+    '''
+    def __init__(self,
+                 safe_combinations: int = SecretEntrance.SAFE_COMBINATIONS,
+                 initial_number: int = SecretEntrance.INITIAL_NUMBER):
+        self.safe_combinations = safe_combinations
+        self.n = initial_number
+        self.stops = 0      # part 1: times the dial stopped on 0
+        self.passes = 0     # part 2: times the dial passed or stopped on 0
+
+    def turn(self, direction: str, amount: int):
+        self.passes += SecretEntrance._calc_count_v2(self.n, direction, amount, self.safe_combinations)
+
+        self.n = (self.n + SecretEntrance.DIRECTION[direction]*amount) % self.safe_combinations
+        if self.n == 0:
+            self.stops += 1
@@ -1,4 +1,4 @@
-from main import SecretEntrance
+from main import SecretEntrance, Dial
 from pathlib import Path
 
 def validate(data_filepath: str, answer_filepath: str):
@@ -10,6 +10,12 @@ def validate(data_filepath: str, answer_filepath: str):
             validator = SecretEntrance(data_filepath)
             assert validator.calc_part1() == answer_1
             assert validator.calc_part2() == answer_2
+            assert SecretEntrance.calc_batch(data_filepath) == (answer_1, answer_2)
+
+            streamer = SecretEntrance(data_filepath, streaming=True)
+            assert streamer.calc_part1() == answer_1
+            assert streamer.calc_part2() == answer_2
+            assert SecretEntrance.calc_batch(data_filepath, chunk_size=16) == (answer_1, answer_2)
 
 assert SecretEntrance._calc_count_v2(50, 'R', 50) == 1
 assert SecretEntrance._calc_count_v2(50, 'L', 50) == 1
@@ -19,6 +25,15 @@ assert SecretEntrance._calc_count_v2(5, 'L', 10) == 1
 assert SecretEntrance._calc_count_v2(5, 'L', 105) == 2
 assert SecretEntrance._calc_count_v2(50, 'L', 1000) == 10
 
+assert SecretEntrance._parse_chunk(b'L10\nR1005\n') == [-10, 1005]
+assert SecretEntrance._count_moves(50, [50, -5, 105, -1000], 100) == (0, 3, 13)
+assert SecretEntrance._count_moves(0, [-5, 5, 0], 7) == (0, 2, 1)
+
+dial = Dial()
+for (direction, amount) in [('R', 50), ('L', 5), ('R', 105), ('L', 1000)]:
+    dial.turn(direction, amount)
+assert (dial.n, dial.stops, dial.passes) == (0, 3, 13)
+
 validate('./test.txt', './test_answer.txt')
 validate('./data.txt', './answer.txt')
 
@@ -8,7 +8,8 @@ f'''
     Part 2:
     Count the number of invalid IDs in the ranges that have 2 or more repeating patters, e.g. 121212.
 '''
-from typing import Set, List, Optional
+from bisect import bisect_left, bisect_right
+from typing import List, Tuple, Dict, Optional
 
 class GiftShop:
     def __init__(self, filepath: str):
@@ -16,7 +17,11 @@ class GiftShop:
         with open(filepath, 'r') as f:
             self.ranges = [[int(v) for v in x.split('-')] for x in f.readline().strip().split(',')]
 
-    def _generate_equal_length_ranges(self, r, allow_odd: bool) -> List[Optional[List[int,int]]]:
+        # number of digits -> (starts, ends) of the sorted, non-overlapping ranges of IDs with that many digits. Built
+        # by _length_buckets() the first time it is needed and reused for every question after that.
+        self._buckets: Optional[Dict[int, Tuple[List[int], List[int]]]] = None
+
+    def _generate_equal_length_ranges(self, r, allow_odd: bool) -> List[Tuple[int, int]]:
         '''
         This function takes a range (e.g. 10->2050) and generates a series of ranges where the length of the
         start and end are equal
@@ -50,56 +55,137 @@ class GiftShop:
 
         return ranges
 
-    def _find_invalid_id(self, r0: int, r1: int, split_by: int):
-        if split_by > len(str(r0)):
-            return set()
-
-        if len(str(r0)) % split_by != 0:
-            return set()
+    @staticmethod
+    def _mobius(n: int) -> int:
+        '''
+        The Mobius function: 0 if n has a squared prime factor, else -1 or 1 for an odd or even number of prime factors
+        '''
+        result = 1
+        p = 2
+        while p * p <= n:
+            if n % p == 0:
+                n //= p
+                if n % p == 0:
+                    return 0
+                result = -result
+            p += 1
+
+        return -result if n > 1 else result
+
+    @staticmethod
+    def _count_and_sum_repeated(r0: int, r1: int, length: int, block_length: int) -> Tuple[int, int]:
+        '''
+        Count and sum the numbers in r0-r1 (which all have the same number of digits, length) that are made of a block
+        of block_length digits repeated, without generating them. Repeating a block k times is the same as multiplying
+        it by (10^(k*L)-1)/(10^L-1) (e.g. 123123 = 123 * 1001), so the matches are that multiplier times every block
+        in a range, and the sum of a range of blocks is an arithmetic series.
+        '''
+        multiplier = (10**length - 1) // (10**block_length - 1)
+        first_block = max(10**(block_length-1), -(-r0 // multiplier))
+        last_block = min(10**block_length - 1, r1 // multiplier)
+        if last_block < first_block:
+            return 0, 0
 
-        matches = set()
-        l = len(str(r0))
+        count = last_block - first_block + 1
+        return count, multiplier * (first_block + last_block) * count // 2
 
-        lh = l // split_by
+    @staticmethod
+    def _count_and_sum_by_period(r0: int, r1: int, length: int) -> Dict[int, Tuple[int, int]]:
+        '''
+        Count and sum the numbers in r0-r1 (all with length digits) grouped by their shortest repeating block (period),
+        e.g. 121212 has period 2 and 111111 has period 1.
 
-        rr0 = int(str(r0)[:lh])
-        rr1 = int(str(r1)[:lh])
+        _count_and_sum_repeated() gives the totals over all periods dividing a block length d, and inclusion-exclusion
+        over the divisors of d (Mobius inversion) turns that into the totals for period exactly d. Grouping this way
+        means a number that repeats in more than one way (111111 is 111 twice and 11 three times) is only counted
+        once, without collecting the matches in a set.
 
-        for x in range(rr0, rr1+1):
-            xx = int(str(x)*split_by)
-            if xx > r1:
-                break
-            elif xx >= r0:
-                matches.add(xx)
+        Returns: period -> (count, sum), for each period that divides length
+        '''
+        divisors = [d for d in range(1, length+1) if length % d == 0]
+        repeated = {d: GiftShop._count_and_sum_repeated(r0, r1, length, d) for d in divisors}
 
-        return matches
+        by_period = {}
+        for period in divisors:
+            terms = [(GiftShop._mobius(period // d), repeated[d]) for d in divisors if period % d == 0]
+            by_period[period] = (sum([m * c for (m, (c, _)) in terms]), sum([m * t for (m, (_, t)) in terms]))
 
-    def _answer(self, allow_odd: bool, split_by: int):
-        matches = set()
+        return by_period
 
-        for r in self.ranges:
-            possible_ranges = self._generate_equal_length_ranges(r, allow_odd=allow_odd)
+    @staticmethod
+    def _is_invalid_period(length: int, period: int, split_bys: List[int]) -> bool:
+        '''
+        A number with this period is its first period digits repeated length/period times, and so is a k-repetition
+        for every k that divides length/period
+        '''
+        return any([(length // period) % k == 0 for k in split_bys])
 
-            for (r0, r1) in possible_ranges:
-                matches |= self._find_invalid_id(r0, r1, split_by=split_by)
+    def _merged_ranges(self) -> List[List[int]]:
+        '''
+        The ranges (either way round) sorted, with overlapping or touching ones combined, so that no ID is counted twice
+        '''
+        merged = []
+        for (r0, r1) in sorted([[min(r), max(r)] for r in self.ranges]):
+            if merged and r0 <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], r1)
+            else:
+                merged.append([r0, r1])
+
+        return merged
+
+    def _length_buckets(self) -> Dict[int, Tuple[List[int], List[int]]]:
+        if self._buckets is None:
+            self._buckets = {}
+            for r in self._merged_ranges():
+                for (r0, r1) in self._generate_equal_length_ranges(r, allow_odd=True):
+                    (starts, ends) = self._buckets.setdefault(len(str(r0)), ([], []))
+                    starts.append(r0)
+                    ends.append(r1)
+
+        return self._buckets
+
+    def batch_query(self,
+                    split_policies: List[List[int]],
+                    query_ranges: Optional[List[Tuple[int, int]]] = None) -> List[List[Tuple[int, int]]]:
+        '''
+        Count and sum the invalid IDs for several split policies and several ranges in one pass over the loaded ranges.
+        The per-period totals of each piece of a range are worked out once and shared by all the policies.
 
-        return matches
+        Args:
+            split_policies: Each a list of the split_by values that make an ID invalid, e.g. [2] for part 1
+            query_ranges: The ranges (inclusive) to ask about, only counting IDs that are also in the loaded ranges.
+                          None asks about all the loaded ranges.
 
+        Returns: results[i][j] is (count, sum) of the invalid IDs in query_ranges[i] under split_policies[j]
+        '''
+        buckets = self._length_buckets()
+        if query_ranges is None:
+            query_ranges = [(0, 10**max(buckets, default=0))]
+
+        results = []
+        for (q0, q1) in query_ranges:
+            totals = [[0, 0] for _ in split_policies]
+            for (length, (starts, ends)) in buckets.items():
+                for i in range(bisect_left(ends, q0), bisect_right(starts, q1)):
+                    by_period = self._count_and_sum_by_period(max(starts[i], q0), min(ends[i], q1), length)
+                    for (policy, split_bys) in enumerate(split_policies):
+                        for (period, (count, total)) in by_period.items():
+                            if self._is_invalid_period(length, period, split_bys):
+                                totals[policy][0] += count
+                                totals[policy][1] += total
+
+            results.append([(count, total) for (count, total) in totals])
+
+        return results
 
     def _max_range_length(self):
-        return max([len(str(x[1])) for x in self.ranges])
+        return max(self._length_buckets(), default=0)
 
     def answer1(self):
-        return sum(self._answer(allow_odd=False, split_by=2))
+        return self.batch_query([[2]])[0][0][1]
 
     def answer2(self):
-        max_range_length = self._max_range_length()
-
-        matches = set()
-        for l in range(2, max_range_length):
-            matches |= self._answer(allow_odd=True, split_by=l)
-
-        return sum(matches)
+        return self.batch_query([list(range(2, self._max_range_length()))])[0][0][1]
 
 if __name__ == '__main__':
     gs_test = GiftShop('test.txt')
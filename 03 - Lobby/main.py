@@ -9,62 +9,102 @@ f'''
     Find the largest 'joltage' using 12 digits - the largest 12 digits of each number in the list - left to right.
 '''
 
-from typing import List, Tuple
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
 
 class Lobby:
+    CHUNK_SIZE = 1 << 20    # bytes of banks handed to a worker at a time by batch_answers()
+
     def __init__(self, filepath: str):
-        self.banks = []
+        self.banks: List[bytes] = []
 
-        with open(filepath, 'r') as f:
-            self.banks = [[int(b) for b in l.strip()] for l in f.readlines() if l.strip() != '']
+        with open(filepath, 'rb') as f:
+            self.banks = [l.strip() for l in f.readlines() if l.strip() != b'']
 
     @staticmethod
-    def _find_largest_digit(digit_list: List[int]) -> Tuple[int, int]:
+    def find_largest_joltage(bank: bytes, num_digits: int=2) -> int:
         '''
-        This function looks through the list of integers and finds the largest number (and its position). This may
-        be called with only portions of a bank.
+        Find the largest number made of num_digits of the bank's digits, in order. Going left to right, each digit
+        knocks out the smaller digits kept before it, as long as there are still enough digits to the right to make up
+        num_digits; what is left on the stack (largest first) is the answer. Each digit is pushed and popped at most
+        once, so this is linear in the length of the bank whatever num_digits is.
 
         Args:
-            digit_list: list of integers
-
-        Returns: (digit, position
+            bank: The digits of the bank as text, e.g. b'987654321111111'
+            num_digits: The number of digits to pick
 
+        Returns: The maximum joltage for the bank
         '''
-        found_digit = found_position = None
-        for a_position, a_digit in enumerate(digit_list):
-            if a_digit == 9:  # If we find a 9, that is the best we can do...return
-                return a_digit, a_position
-            elif found_digit is None or a_digit > found_digit:
-                found_digit = a_digit
-                found_position = a_position
+        can_drop = len(bank) - num_digits
+        stack = bytearray()
+        for digit in bank:
+            while can_drop > 0 and stack and stack[-1] < digit:
+                stack.pop()
+                can_drop -= 1
+            stack.append(digit)
 
-        return found_digit, found_position
+        joltage = 0
+        for digit in stack[:num_digits]:
+            joltage = joltage * 10 + digit - 48     # 48 is ord('0')
 
+        return joltage
 
-    def find_largest_joltage(self, digit_list: List[int], num_digits: int=2) -> int:
+    @staticmethod
+    def _sum_chunk(chunk: List[bytes], digit_counts: Tuple[int, ...]) -> List[int]:
         '''
-        This is a recursive function that looks for the largest 'n' digits based on the num_digits argument. It will
-        start at the left and look for the largest number, with the constraint that there must be enough digits
-        remaining to the right to support num_digits. If there are only num_digits left to the right, it must pick
-        up the first digit in the (sub-)bank.
-
-        Args:
-            digit_list: a full (or partial) bank of integers
-            num_digits: The number of remaining digits to find
-
-        Returns: The maximum joltage for the bank
+        The total joltage of a chunk of lines (banks) for each number of digits
+        '''
+        banks = [line.strip() for line in chunk if line.strip() != b'']
+        return [sum([Lobby.find_largest_joltage(bank, num_digits) for bank in banks]) for num_digits in digit_counts]
 
+    @staticmethod
+    def batch_answers(filepath: str,
+                      digit_counts: Tuple[int, ...] = (2, 12),
+                      workers: Optional[int] = None,
+                      chunk_size: int = CHUNK_SIZE) -> List[int]:
         '''
-        if num_digits == 1:
-            digit, position = Lobby._find_largest_digit(digit_list)
-            return digit
-        else:
-            digit, position = Lobby._find_largest_digit(digit_list[:-(num_digits - 1)])
-            remaining_digits = self.find_largest_joltage(digit_list[position + 1:], num_digits - 1)
+        Total joltage of every bank in a file for several numbers of digits at once, without loading the file. The
+        banks are read as raw bytes in chunks of roughly chunk_size bytes (always whole lines) and shared out across a
+        pool of worker processes; each worker works out every number of digits for its chunk, and the totals are added
+        up as the chunks come back. Only a couple of chunks per worker are in flight at once, so memory use does not
+        grow with the file.
 
-            joltage = int(f'{digit}{remaining_digits}')
+        Args:
+            filepath: The bank file
+            digit_counts: The num_digits values to total, e.g. (2, 12) for both answers
+            workers: The number of worker processes, None for one per CPU, or 1 to work in this process
+            chunk_size: Roughly how many bytes of banks to give a worker at a time
 
-            return joltage
+        Returns: The total joltage for each of digit_counts, in the same order
+        '''
+        digit_counts = tuple(digit_counts)
+        totals = [0] * len(digit_counts)
+
+        def add(chunk_totals: List[int]):
+            for (i, total) in enumerate(chunk_totals):
+                totals[i] += total
+
+        with open(filepath, 'rb') as f:
+            if workers == 1:
+                while chunk := f.readlines(chunk_size):
+                    add(Lobby._sum_chunk(chunk, digit_counts))
+                return totals
+
+            workers = workers if workers is not None else os.cpu_count() or 1
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                max_in_flight = 2 * workers
+                in_flight = deque()
+                while chunk := f.readlines(chunk_size):
+                    if len(in_flight) >= max_in_flight:
+                        add(in_flight.popleft().result())
+                    in_flight.append(executor.submit(Lobby._sum_chunk, chunk, digit_counts))
+
+                while in_flight:
+                    add(in_flight.popleft().result())
+
+        return totals
 
     def answer1(self):
         return sum([self.find_largest_joltage(bank) for bank in self.banks])
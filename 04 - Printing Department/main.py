@@ -8,21 +8,42 @@
     Part 2:
     If we continue tyo remove paper rolls until we can remove no more, how many are lect?
 '''
+from collections import deque
+from typing import List, Tuple, Optional
 
 
 class PrintingDepartmentMap:
     PAPER_ROLL='@'
     SPACE='.'
     MAX_ALLOWED_ROLLS = 4
+    _LANE_BITS = 4  # bits per cell in the packed rows used by neighbour_counts(), enough to count up to 9
 
-    def __init__(self, filepath: str):
+    def __init__(self, filepath: str, bit_packed: bool = False):
+        '''
+        Args:
+            filepath: The map file
+            bit_packed: Only keep the map as bit_rows, one int per row with a bit per cell (1 for a roll, leftmost cell
+                        in the highest bit), rather than as text. This uses an eighth of the memory of a byte per
+                        cell and answer1()/answer2() then work on whole rows at a time (see bitboard_round_counts()).
+        '''
         super().__init__()
+        self.bit_packed = bit_packed
+        self.map: Optional[List[str]] = None
+        self.bit_rows: Optional[List[int]] = None
 
         with open(filepath, 'r') as f:
-            self.map = [l.strip() for l in f.readlines() if l.strip() != '']
-
-        self.width = len(self.map[0])
-        self.height = len(self.map)
+            if bit_packed:
+                rolls = str.maketrans({PrintingDepartmentMap.PAPER_ROLL: '1', PrintingDepartmentMap.SPACE: '0'})
+                self.bit_rows = []
+                for l in f:
+                    if l.strip() != '':
+                        self.width = len(l.strip())
+                        self.bit_rows.append(int(l.strip().translate(rolls), 2))
+                self.height = len(self.bit_rows)
+            else:
+                self.map = [l.strip() for l in f.readlines() if l.strip() != '']
+                self.width = len(self.map[0])
+                self.height = len(self.map)
 
     def _can_move_paper_roll(self, x: int, y: int) -> bool:
         '''
@@ -54,29 +75,161 @@ class PrintingDepartmentMap:
 
         return cnt < PrintingDepartmentMap.MAX_ALLOWED_ROLLS
 
+    def _packed_rows(self) -> List[int]:
+        '''
+        Each row as one int with a 4 bit lane per cell, 1 for a roll and 0 for a space, with the leftmost cell in the
+        highest lane (so the row reads the same way when printed in hex)
+        '''
+        if self.bit_packed:     # spread each bit into a lane by reading the row's binary digits as hex digits
+            return [int(f'{row:0{self.width}b}', 16) for row in self.bit_rows]
+
+        rolls = str.maketrans({PrintingDepartmentMap.PAPER_ROLL: '1', PrintingDepartmentMap.SPACE: '0'})
+        return [int(row.translate(rolls), 16) for row in self.map]
+
+    def neighbour_counts(self) -> List[int]:
+        '''
+        Count the rolls around every cell at once. Shifting a packed row one lane left and right and adding it to
+        itself gives, in each lane, the number of rolls in the 1x3 window around that cell; adding the windows of the
+        rows above and below gives the 3x3 count. No lane can reach 16, so the lanes never carry into each other and
+        the whole map is counted with a few big integer additions per row rather than a check per cell.
+
+        Returns: Each row as an int with a 4 bit lane per cell (as _packed_rows()) holding the number of rolls in the
+                 8 cells around it
+        '''
+        lane = PrintingDepartmentMap._LANE_BITS
+        all_lanes = (1 << (lane * self.width)) - 1
+        rows = self._packed_rows()
+        windows = [((row << lane) + row + (row >> lane)) & all_lanes for row in rows] + [0]   # windows[-1] is above row 0
+
+        return [windows[y-1] + windows[y] + windows[y+1] - rows[y] for y in range(0, self.height)]
+
+    def removable_mask(self) -> List[str]:
+        '''
+        Returns: One string per row with a character per cell, '1' where there is a roll that can be moved, else '0'
+        '''
+        low_bits = int('1' * self.width, 16)    # the lowest bit of every lane
+        masks = []
+        for (row, counts) in zip(self._packed_rows(), self.neighbour_counts()):
+            # A count is >= MAX_ALLOWED_ROLLS (4) exactly when either of the top two bits of its lane is set
+            too_many = ((counts >> 2) | (counts >> 3)) & low_bits
+            masks.append(f'{row & ~too_many:0{self.width}x}')
+
+        return masks
+
+    @staticmethod
+    def _bitboard_removable(rows: List[int], width: int) -> List[int]:
+        '''
+        The rolls that can be moved, for bit-packed rows, working on whole rows at a time as Life-style bitboards do.
+        The 8 neighbours of every cell in a row are 8 shifted copies of the rows above, below and itself, which are
+        added up with half adders into 4 bit planes (the 1s, 2s, 4s and 8s bits of each cell's count). Comparing the
+        planes with MAX_ALLOWED_ROLLS from the top bit down then gives every cell with too many neighbours at once.
+
+        Returns: A bit-packed row for each row, with the bits set for the rolls that can be moved
+        '''
+        all_cells = (1 << width) - 1
+        removable = []
+        for y in range(0, len(rows)):
+            above = rows[y-1] if y > 0 else 0
+            below = rows[y+1] if y+1 < len(rows) else 0
+            neighbours = [(above << 1) & all_cells, above, above >> 1,
+                          (rows[y] << 1) & all_cells, rows[y] >> 1,
+                          (below << 1) & all_cells, below, below >> 1]
+
+            planes = [0, 0, 0, 0]   # bit plane i has bit x set when the count for cell x has 2^i set
+            for carry in neighbours:
+                for i in range(0, len(planes)):
+                    (planes[i], carry) = (planes[i] ^ carry, planes[i] & carry)
+
+            too_many = 0
+            equal = all_cells  # cells whose count matches MAX_ALLOWED_ROLLS in the planes compared so far
+            for i in reversed(range(0, len(planes))):
+                if PrintingDepartmentMap.MAX_ALLOWED_ROLLS >> i & 1:
+                    equal &= planes[i]
+                else:
+                    too_many |= equal & planes[i]
+                    equal &= ~planes[i]
+            too_many |= equal
+
+            removable.append(rows[y] & ~too_many)
+
+        return removable
+
+    def bitboard_round_counts(self) -> List[int]:
+        '''
+        Remove rolls in rounds on the bit-packed rows, each round taking away every roll that can be moved at the start
+        of the round (the same rounds as removal_order()). The map is not changed.
+
+        Returns: The number of rolls removed in each round
+        '''
+        rows = self.bit_rows if self.bit_packed else [int(f'{row:x}', 2) for row in self._packed_rows()]
+        counts = []
+        while True:
+            removable = PrintingDepartmentMap._bitboard_removable(rows, self.width)
+            count = sum([row.bit_count() for row in removable])
+            if count == 0:
+                return counts
+
+            counts.append(count)
+            rows = [row & ~removed for (row, removed) in zip(rows, removable)]
+
     def answer1(self):
-        return sum([1 if self._can_move_paper_roll(x,y) else 0
-                      for y in range(0, self.width)
-                      for x in range(0, self.height)])
+        if self.bit_packed:
+            return sum([row.bit_count() for row in self._bitboard_removable(self.bit_rows, self.width)])
 
-    def answer2(self):
-        total_cnt = 0
+        return sum([row.count('1') for row in self.removable_mask()])
 
-        cnt=None
-        while cnt is None or cnt > 0:
-            cnt = 0
+    def removal_order(self) -> List[Tuple[Tuple[int, int], int]]:
+        '''
+        Remove rolls until no more can be moved, without rescanning the map. The neighbour counts are worked out once
+        (see neighbour_counts()) and the movable rolls go on a queue; taking a roll away only changes the counts of
+        its 8 neighbours, and any neighbour that drops below MAX_ALLOWED_ROLLS joins the queue. Every cell is queued
+        at most once, so this is linear in the size of the map however long the cascade is. The map is not changed.
 
-            for y in range(0, self.height):
-                for x in range(0, self.width):
-                    if self._can_move_paper_roll(x,y):
-                        # Replace character at [x,y] - i.e. remove paper roll
-                        self.map[y] = self.map[y][:x] + PrintingDepartmentMap.SPACE + self.map[y][x+1:]
+        Rounds are numbered from 1, the rolls that can be moved straight away; a roll is in round n+1 when it can only
+        be moved once the rolls in rounds 1 to n have gone.
 
-                        cnt += 1
+        Returns: The rolls as ((x, y), round) in the order they were removed, which is by round
+        '''
+        width = self.width
+        lane_values = bytes.maketrans(b'0123456789', bytes(range(0, 10)))
+
+        def unpack(rows: List[int]) -> bytearray:   # packed rows -> one byte per cell, row by row
+            return bytearray(b''.join([f'{row:0{width}x}'.encode('ascii').translate(lane_values) for row in rows]))
+
+        counts = unpack(self.neighbour_counts())
+        present = unpack(self._packed_rows())
+        queued = bytearray(len(present))
+
+        to_remove = deque()
+        for i in range(0, len(present)):
+            if present[i] and counts[i] < PrintingDepartmentMap.MAX_ALLOWED_ROLLS:
+                queued[i] = 1
+                to_remove.append((i, 1))
+
+        removed = []
+        while to_remove:
+            (i, removal_round) = to_remove.popleft()
+            present[i] = 0
+            (y, x) = divmod(i, width)
+            removed.append(((x, y), removal_round))
+
+            for yy in range(max(y-1, 0), min(y+2, self.height)):
+                for xx in range(max(x-1, 0), min(x+2, width)):
+                    j = yy * width + xx
+                    if j == i:
+                        continue
+                    counts[j] -= 1
+                    if present[j] and not queued[j] and counts[j] < PrintingDepartmentMap.MAX_ALLOWED_ROLLS:
+                        queued[j] = 1
+                        to_remove.append((j, removal_round + 1))
+
+        return removed
 
-            total_cnt += cnt
+    def answer2(self):
+        if self.bit_packed:
+            return sum(self.bitboard_round_counts())
 
-        return total_cnt
+        return len(self.removal_order())
 
 
 if __name__ == '__main__':
@@ -9,15 +9,200 @@
     Find the total number of fresh ingredients based on just the ranges.
 '''
 
-from bisect import bisect
+import sys
+import tempfile
+from bisect import bisect_left
+from heapq import merge
+from typing import List, Iterable, Iterator, Tuple, Optional
+
+class RangeSet:
+    '''
+    A set of IDs held as sorted, non-overlapping ranges that can be changed one range at a time: adding a range merges
+    it with any it overlaps or touches, and removing one trims or splits the ranges it overlaps. The total number of
+    IDs covered is kept up to date as ranges change.
+
+    After add() and remove() no two ranges touch, but split() deliberately leaves two touching ranges, which len() and
+    iteration report as separate ranges until an add() over them merges them again.
+
+    The ranges are kept in blocks of parallel starts/ends lists, with the last end of each block in a separate list.
+    A range is found by bisecting that list for its block and then the block itself, and a change only shifts the
+    ranges within one block (splitting it in two once it holds more than twice the block size). The block size starts
+    at BLOCK_SIZE and doubles, regrouping every range, whenever the set grows past four times its square, so blocks
+    hold around the square root of the number of ranges and each change costs O(sqrt(n)).
+    '''
+    BLOCK_SIZE = 512
+
+    def __init__(self, ranges: Iterable[Tuple[int, int]] = ()):
+        self._starts: List[List[int]] = []  # per block, the starts of its ranges
+        self._ends: List[List[int]] = []    # per block, the ends of its ranges
+        self._last_ends: List[int] = []     # per block, the end of its last range
+        self._count = 0
+        self._block_size = RangeSet.BLOCK_SIZE
+        self.covered = 0    # the number of IDs in the set
+
+        for (r_min, r_max) in ranges:
+            self.add(r_min, r_max)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        for (starts, ends) in zip(self._starts, self._ends):
+            yield from zip(starts, ends)
+
+    def _find(self, id: int) -> Tuple[int, int]:
+        '''
+        Returns: (block, index in block) of the first range that ends at or after id, or (number of blocks, 0) if
+                 there is none
+        '''
+        block = bisect_left(self._last_ends, id)
+        if block == len(self._last_ends):
+            return block, 0
+        return block, bisect_left(self._ends[block], id)
+
+    def _delete(self, block: int, i: int) -> Tuple[int, int]:
+        '''
+        Delete the range at (block, i).
+
+        Returns: (block, index in block) of the range that followed it
+        '''
+        self.covered -= self._ends[block][i] - self._starts[block][i] + 1
+        self._count -= 1
+        del self._starts[block][i]
+        del self._ends[block][i]
+        if not self._starts[block]:
+            del self._starts[block]
+            del self._ends[block]
+            del self._last_ends[block]
+            return block, 0
+
+        self._last_ends[block] = self._ends[block][-1]
+        return (block, i) if i < len(self._starts[block]) else (block + 1, 0)
+
+    def _insert(self, r_min: int, r_max: int):
+        '''
+        Insert a range that does not overlap any other, splitting its block in two if the block gets too big
+        '''
+        self.covered += r_max - r_min + 1
+        self._count += 1
+        if not self._starts:
+            self._starts.append([r_min])
+            self._ends.append([r_max])
+            self._last_ends.append(r_max)
+            return
+
+        (block, i) = self._find(r_min)
+        if block == len(self._starts):  # after every range, so on the end of the last block
+            (block, i) = (block - 1, len(self._starts[block - 1]))
+        self._starts[block].insert(i, r_min)
+        self._ends[block].insert(i, r_max)
+        self._last_ends[block] = self._ends[block][-1]
+
+        if self._count > 4 * self._block_size * self._block_size:
+            self._regroup(2 * self._block_size)
+        elif len(self._starts[block]) > 2 * self._block_size:
+            half = self._block_size
+            self._starts[block+1:block+1] = [self._starts[block][half:]]
+            self._ends[block+1:block+1] = [self._ends[block][half:]]
+            del self._starts[block][half:]
+            del self._ends[block][half:]
+            self._last_ends[block:block+1] = [self._ends[block][-1], self._ends[block+1][-1]]
+
+    def _regroup(self, block_size: int):
+        '''
+        Regroup every range into blocks of block_size ranges
+        '''
+        starts = [start for block in self._starts for start in block]
+        ends = [end for block in self._ends for end in block]
+        self._starts = [starts[i:i+block_size] for i in range(0, len(starts), block_size)]
+        self._ends = [ends[i:i+block_size] for i in range(0, len(ends), block_size)]
+        self._last_ends = [block[-1] for block in self._ends]
+        self._block_size = block_size
+
+    def add(self, r_min: int, r_max: int):
+        # Absorb every range from the first that ends at or after the one before r_min, up to the last that starts at
+        # or before the one after r_max
+        (block, i) = self._find(r_min - 1)
+        while block < len(self._starts) and self._starts[block][i] <= r_max + 1:
+            (r_min, r_max) = (min(r_min, self._starts[block][i]), max(r_max, self._ends[block][i]))
+            (block, i) = self._delete(block, i)
+
+        self._insert(r_min, r_max)
+
+    def remove(self, r_min: int, r_max: int):
+        pieces = []     # the parts of the overlapping ranges either side of r_min-r_max, which are kept
+        (block, i) = self._find(r_min)
+        while block < len(self._starts) and self._starts[block][i] <= r_max:
+            (start, end) = (self._starts[block][i], self._ends[block][i])
+            if start < r_min:
+                pieces.append((start, r_min - 1))
+            if end > r_max:
+                pieces.append((r_max + 1, end))
+            (block, i) = self._delete(block, i)
+
+        for (start, end) in pieces:
+            self._insert(start, end)
+
+    def split(self, id: int):
+        '''
+        Split the range containing id (if any) so that a range starts at id, e.g. splitting 10-20 at 15 gives 10-14
+        and 15-20. The IDs in the set are unchanged, but the two ranges touch until an add() over them merges them.
+        '''
+        (block, i) = self._find(id)
+        if block < len(self._starts) and self._starts[block][i] < id:
+            (start, end) = (self._starts[block][i], self._ends[block][i])
+            self._delete(block, i)
+            self._insert(start, id - 1)
+            self._insert(id, end)
+
+    def contains(self, id: int) -> bool:
+        (block, i) = self._find(id)
+        return block < len(self._starts) and self._starts[block][i] <= id
+
+    def classify(self, ids: Iterable[int]) -> List[bool]:
+        '''
+        Check a whole batch of IDs at once. The IDs are sorted and then walked alongside the (sorted) ranges, so each
+        range and each ID is looked at once after the sort, rather than a search per ID.
+
+        Args:
+            ids: the IDs to check, in any order
+
+        Returns: True/False for each ID (in the order given) for whether it is in the set
+        '''
+        ids = list(ids)
+        fresh = [False] * len(ids)
+
+        ranges = iter(self)
+        (r_min, r_max) = next(ranges, (None, None))
+        for i in sorted(range(0, len(ids)), key=ids.__getitem__):
+            while r_max is not None and r_max < ids[i]:
+                (r_min, r_max) = next(ranges, (None, None))
+            if r_max is None:
+                break
+            fresh[i] = r_min <= ids[i]
+
+        return fresh
+
 
 class Cafeteria:
-    def __init__(self, filepath: str):
-        self.fresh_ranges = []
+    def __init__(self, filepath: str, external_sort_ranges: Optional[int] = None):
+        '''
+        Args:
+            filepath: The path to the data file to be loaded (see _load_file())
+            external_sort_ranges: Don't hold all the ranges from the file in memory, merge them with
+                                  external_merge_ranges(), sorting this many ranges at a time
+        '''
+        self._loaded_ranges = []   # the ranges from the file, until _build_index() moves them into range_set
         self.food = []
+        self._external_sort_ranges = external_sort_ranges
+
+        # The merged ranges, which can also be changed after loading (see handle_event())
+        self.range_set = RangeSet()
 
+        self._filepath = filepath
         self._load_file(filepath)
         self._merge_ranges()
+        self._build_index()
 
     def _load_file(self, filepath: str):
         '''
@@ -41,81 +226,207 @@ class Cafeteria:
         '''
         load_state='RANGES'
         with open(filepath, 'r') as f:
-            for line in f.readlines():
+            for line in f:
                 if load_state == 'RANGES':
                     if line.strip() == '':
                         load_state='FOOD'
-                    else:
-                        (range_start, range_end) = tuple(line.strip().split('-'))
-                        self.fresh_ranges.append((int(range_start), int(range_end)))
+                    elif self._external_sort_ranges is None:
+                        self._loaded_ranges.append(Cafeteria._parse_range(line))
                 elif load_state == 'FOOD':
                     self.food.append(int(line.strip()))
                 else:
                     raise NotImplementedError(f'Unknown load state {load_state}')
 
-    def _sort_ranges(self) -> None:
+    @staticmethod
+    def _parse_range(line: str) -> Tuple[int, int]:
+        (range_start, range_end) = tuple(line.strip().split('-'))
+        return int(range_start), int(range_end)
+
+    @staticmethod
+    def _merge_sorted(ranges: Iterable[Tuple[int, int]]) -> Iterator[Tuple[int, int]]:
         '''
-        Sort the ranges by creating a sort key that consists of the from and to numbers concatenated, but each number
-        has to be zero-padded to ensure they are truly in order (e.g. 10|5 vs 10|05 yield different results).
+        Merge ranges that are already sorted in a single pass, extending the current range for as long as the next
+        one overlaps or touches it (e.g. 10-20 and 21-30 become 10-30).
 
-        Returns: None
+        Args:
+            ranges: (start, end) ranges in order
 
+        Returns: generator of the sorted, non-overlapping ranges
         '''
-        m = len(str(max([n[1] for n in self.fresh_ranges])))  # length of longest number
-
-        self.fresh_ranges = sorted(self.fresh_ranges, key=lambda x: f'{str(x[0]).zfill(m)}|{str(x[1]).zfill(m)})')
+        current = None
+        for (r_min, r_max) in ranges:
+            if current is None:
+                current = (r_min, r_max)
+            elif r_min <= current[1]+1:  # Must be +1 to merge 10-20 and 21-30
+                current = (current[0], max(current[1], r_max))
+            else:
+                yield current
+                current = (r_min, r_max)
+
+        if current is not None:
+            yield current
 
     def _merge_ranges(self) -> None:
         '''
-        This function works backwards from the highest range to the lowest (after sorting) and merges any ranges
-        that overlap. So if range N overlaps range N-1, range N-1 is updated to incorporate the range N, then N
-        is removed. This ensures that at the end, the list of ranges is a sorted, non-overlapping list of ranges.
+        Sort the ranges (as tuples of ints, so by start and then end) and merge any that overlap, leaving a sorted,
+        non-overlapping list of ranges.
 
         Returns: None
 
         '''
+        if self._external_sort_ranges is not None:
+            self._loaded_ranges = list(Cafeteria.external_merge_ranges(self._filepath, self._external_sort_ranges))
+        else:
+            self._loaded_ranges = list(Cafeteria._merge_sorted(sorted(self._loaded_ranges)))
 
-        self._sort_ranges()
+    @staticmethod
+    def external_merge_ranges(filepath: str, max_ranges: int = 1_000_000) -> Iterator[Tuple[int, int]]:
+        '''
+        Merge the ranges in a file that may be too big to load. The ranges are read max_ranges at a time, and each
+        batch is sorted, merged and written to a temporary file (a 'run'). The runs are then read back together
+        with heapq.merge(), which gives all the ranges in order while holding only one range per run in memory, and
+        merged as they stream past.
 
-        for i in reversed(range(0, len(self.fresh_ranges)-1)):
-            (r0_min, r0_max) = self.fresh_ranges[i]
-            (r1_min, r1_max) = self.fresh_ranges[i+1]
+        Args:
+            filepath: A data file as for _load_file() (only the ranges before the blank line are used)
+            max_ranges: How many ranges to sort in memory at once
 
-            assert r0_min <= r1_min
+        Returns: generator of the sorted, non-overlapping ranges
+        '''
+        def write_run(batch: List[Tuple[int, int]]):
+            run = tempfile.TemporaryFile('w+')
+            run.writelines([f'{r_min}-{r_max}\n' for (r_min, r_max) in Cafeteria._merge_sorted(sorted(batch))])
+            return run
+
+        def read_run(run) -> Iterator[Tuple[int, int]]:
+            run.seek(0)
+            for line in run:
+                yield Cafeteria._parse_range(line)
+
+        runs = []
+        try:
+            with open(filepath, 'r') as f:
+                batch = []
+                for line in f:
+                    if line.strip() == '':
+                        break
+                    batch.append(Cafeteria._parse_range(line))
+                    if len(batch) == max_ranges:
+                        runs.append(write_run(batch))
+                        batch = []
+                if batch:
+                    runs.append(write_run(batch))
+
+            yield from Cafeteria._merge_sorted(merge(*[read_run(run) for run in runs]))
+        finally:
+            for run in runs:
+                run.close()
+
+    def _build_index(self) -> None:
+        self.range_set = RangeSet(self._loaded_ranges)
+        self._loaded_ranges = []
 
-            if r1_min <= r0_max+1:  # Must be +1 to merge 10-20 and 21-30
-                self.fresh_ranges[i] = (min(r0_min, r1_min), max(r0_max, r1_max))
-                self.fresh_ranges = self.fresh_ranges[:i+1] + self.fresh_ranges[i+2:]
+    @property
+    def fresh_ranges(self) -> List[Tuple[int, int]]:
+        '''
+        The current sorted, non-overlapping ranges, including any changes made by handle_event()
+        '''
+        return list(self.range_set)
 
     def _is_fresh(self, id: int) -> bool:
         '''
-        This function assumes that the ranges are sorted and non-overlapping. The bisect() function will find the
-        position just after the range that starts below the food ID. We then check whether that range expands upwards
-        to include the id. If the bisect returns 0, it means the food ID is below all ranges.
-
         Args:
             n: the ID for the food to check for freshness
 
         Returns: True if the food is on a range or False otherwise
 
         '''
-        p = bisect([r[0] for r in self.fresh_ranges], id)
-        if p == 0:
-            return False
+        return self.range_set.contains(id)
+
+    def classify(self, ids: Iterable[int]) -> List[bool]:
+        '''
+        Check a whole batch of food IDs at once (see RangeSet.classify())
+        '''
+        return self.range_set.classify(ids)
+
+    @staticmethod
+    def read_events(filepath: str) -> Iterator[Tuple[str, int, int]]:
+        '''
+        Generator of events from a feed, one per line, read as they arrive, e.g.
+
+        add 10-20
+        remove 12-13
+        query 15
+
+        Args:
+            filepath: path of the feed, or '-' for stdin
+
+        Returns: (event, start, end) for each line, where a query has start == end == the food ID
+        '''
+        f = sys.stdin if filepath == '-' else open(filepath, 'r')
+        try:
+            for line in f:
+                if line.strip() == '':
+                    continue
+                (event, value) = line.split()
+                if event == 'query':
+                    yield event, int(value), int(value)
+                elif event in ('add', 'remove'):
+                    yield (event, *Cafeteria._parse_range(value))
+                else:
+                    raise ValueError(f'Unknown event {event}, please use add, remove or query')
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+    def handle_event(self, event: str, r_min: int, r_max: int) -> Optional[bool]:
+        '''
+        Apply one event (see read_events()) to the fresh ranges straight away
+
+        Returns: for a query, True if the food ID is fresh, otherwise None
+        '''
+        if event == 'add':
+            self.range_set.add(r_min, r_max)
+        elif event == 'remove':
+            self.range_set.remove(r_min, r_max)
+        elif event == 'query':
+            return self.range_set.contains(r_min)
+        else:
+            raise ValueError(f'Unknown event {event}, please use add, remove or query')
+        return None
+
+    def process_events(self, events: Iterable[Tuple[str, int, int]]) -> Iterator[Tuple[int, bool]]:
+        '''
+        Apply a stream of events (see read_events()) to the fresh ranges as they come, answering each query against
+        the ranges as they are at that point. answer2() stays up to date as ranges are added and removed.
 
-        (i0, i1) = self.fresh_ranges[p - 1]
+        This is a generator, so each event is only applied as the results are read; use apply_events() to apply them
+        all at once.
+
+        Returns: generator of (food ID, True if fresh) for each query
+        '''
+        for (event, r_min, r_max) in events:
+            fresh = self.handle_event(event, r_min, r_max)
+            if fresh is not None:
+                yield r_min, fresh
 
-        return i0 <= id <= i1
+    def apply_events(self, events: Iterable[Tuple[str, int, int]]) -> List[Tuple[int, bool]]:
+        '''
+        Apply every event straight away (see process_events())
+
+        Returns: (food ID, True if fresh) for each query
+        '''
+        return list(self.process_events(events))
 
     @property
     def all_ranges(self):
-        return [(x[0], x[1], x[1]-x[0]+1) for x in self.fresh_ranges]
+        return [(x[0], x[1], x[1]-x[0]+1) for x in self.range_set]
 
     def answer1(self):
-        return sum([1 if self._is_fresh(id) else 0 for id in self.food])
+        return sum(self.classify(self.food))
 
     def answer2(self):
-        return sum([r[1]-r[0]+1 for r in self.fresh_ranges])
+        return self.range_set.covered
 
 if __name__ == '__main__':
     test_cafe = Cafeteria('test.txt')